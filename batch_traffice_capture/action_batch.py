@@ -5,12 +5,15 @@ action_batch.py
 
 批量模式：同一 domain 的多个 URL 共享一个 pcap 文件和一个 ssl_key 文件。
 只保存 pcap 和 ssl_key，不保存 content、html、screenshot。
-接收 JSON 格式：{"domain": "xxx", "urls": [{"row_id": "1", "url": "..."}, ...], "container": "xxx"}
+接收 JSON 格式：{"domain": "xxx", "urls": [{"row_id": "1", "url": "..."}, ...], "container": "xxx",
+               "owner_uid": 1002, "owner_gid": 1002}
+owner_uid/owner_gid 可选：给出时结果文件写完即在容器内 chown，宿主机移动后无需再改属主。
 """
 
 import json
 import sys
 import os
+import signal
 import subprocess
 import time
 import threading
@@ -20,22 +23,19 @@ from logger import logger
 from chrome import create_chrome_driver
 from selenium.webdriver.support.ui import WebDriverWait
 
-
-def _start_reaper():
-    def _loop():
-        while True:
-            try:
-                while True:
-                    pid, _ = os.waitpid(-1, os.WNOHANG)
-                    if pid == 0:
-                        break
-            except ChildProcessError:
-                pass
-            time.sleep(1)
-    threading.Thread(target=_loop, daemon=True).start()
+NETWORK_IDLE_SECS = 2.0       # resource 条目数连续这么久不增长即认为网络空闲
+NETWORK_IDLE_MAX_SECS = 10.0  # 网络空闲等待上限
 
 
-_start_reaper()
+def _reap_children(signum, frame):
+    """SIGCHLD 处理：子进程退出时立即回收，避免僵尸进程（不再用每秒轮询的线程）。"""
+    try:
+        while True:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+    except ChildProcessError:
+        pass
 
 
 def kill_chrome_processes():
@@ -58,15 +58,35 @@ def traffic(domain, formatted_time):
     capture(domain, formatted_time, "batch")
 
 
+def wait_network_idle(driver, idle_secs=NETWORK_IDLE_SECS, max_secs=NETWORK_IDLE_MAX_SECS, poll=0.5):
+    """轮询 performance 的 resource 条目数，连续 idle_secs 不再增长即返回；最多等待 max_secs。"""
+    # 默认缓冲只有 250 条，满了之后计数不再增长会被误判为空闲
+    driver.execute_script("performance.setResourceTimingBufferSize(10000);")
+    deadline = time.monotonic() + max_secs
+    last_count = -1
+    stable_since = time.monotonic()
+    while time.monotonic() < deadline:
+        count = driver.execute_script("return performance.getEntriesByType('resource').length")
+        now = time.monotonic()
+        if count != last_count:
+            last_count = count
+            stable_since = now
+        elif now - stable_since >= idle_secs:
+            return
+        time.sleep(poll)
+
+
 def visit_url(driver, url, wait_secs=8):
     """访问 URL，等待页面加载完成"""
     driver.get(url)
     WebDriverWait(driver, wait_secs).until(lambda d: d.execute_script("return document.readyState") == "complete")
-    time.sleep(15)  # 等待页面完全加载
+    wait_network_idle(driver)  # 等待页面后续请求结束，替代固定 sleep(15)
 
 
-def start_batch_task():
-    payload = json.loads(sys.argv[1])
+def start_batch_task(payload=None):
+    signal.signal(signal.SIGCHLD, _reap_children)
+    if payload is None:
+        payload = json.loads(sys.argv[1])
     container = payload["container"]
     domain = payload["domain"]
     urls = payload["urls"]  # [{"row_id": "1", "url": "..."}, ...]
@@ -124,11 +144,12 @@ def start_batch_task():
 
     # 关闭浏览器
     try:
-        browser.quit()
+        browser.quit()  # 会回收 chromedriver 与 chrome（含 renderer/zygote 子孙进程）
     except Exception as e:
+        # 只有 quit 失败时才按名字扫进程兜底；记录下来的 PID 在 quit 之后可能已被回收并复用，不能再直接 kill
         logger.warning(f"browser.quit() 异常: {e}")
-    logger.info("清理浏览器进程(兜底)")
-    kill_chrome_processes()
+        logger.info("清理浏览器进程(兜底)")
+        kill_chrome_processes()
 
     # 等待 TCP 挥手完成
     logger.info(f"等待TCP结束挥手完成，耗时60秒")
@@ -141,6 +162,13 @@ def start_batch_task():
     ssl_key_file_size = os.path.getsize(ssl_key_file_path) if os.path.exists(ssl_key_file_path) else 0
     logger.info(f"pcap文件大小：{pcap_file_size}，ssl_key文件大小：{ssl_key_file_size}")
 
+    if "owner_uid" in payload and "owner_gid" in payload:
+        for path in (pcap_path, ssl_key_file_path):
+            try:
+                os.chown(path, payload["owner_uid"], payload["owner_gid"])
+            except OSError as e:
+                logger.warning(f"chown {path} 失败，交由宿主机处理: {e}")
+
     # 写入结果（只包含 pcap 和 ssl_key）
     result = {
         "domain": domain,
@@ -150,13 +178,13 @@ def start_batch_task():
         "visited_urls": visited_urls
     }
 
-    if not os.path.exists(os.path.dirname(meta_path)):
-        os.makedirs(os.path.dirname(meta_path))
+    os.makedirs(os.path.dirname(meta_path), exist_ok=True)
     with open(meta_path, "w", encoding="utf-8") as f:
         json.dump(result, f, ensure_ascii=False, indent=2)
 
     logger.info(f"批量任务完成: domain={domain}")
     time.sleep(1)
+    return result
 
 
 if __name__ == "__main__":
@@ -0,0 +1,50 @@
+"""
+常驻版 action_batch：每个容器只启动一次，省掉每个任务一次 docker exec + Python 解释器启动。
+
+    docker exec -i <name> python -u /app/action_batch_server.py
+
+协议（一行一个 JSON）：
+- stdin  每行一个任务 payload，格式与 action_batch.py 的 argv[1] 相同
+- stdout 每个任务回一行 {"ok": true, "result": {...}} 或 {"ok": false, "error": "..."}
+result 即 action_batch.start_batch_task 的返回值（与 /app/meta/{container}_last.json 内容相同）。
+"""
+import json
+import os
+import sys
+
+# 协议独占原始 stdout；fd 1 改指向 stderr，避免 print/子进程输出混进应答
+_reply = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8", buffering=1)
+os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+import action_batch
+from logger import logger, reopen_log_file
+
+try:  # 镜像里装了 orjson 就用它解析/生成任务行，否则用标准库
+    import orjson
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+    json_loads = json.loads
+
+
+def serve():
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            reopen_log_file()
+            result = action_batch.start_batch_task(json_loads(line))
+            reply = {"ok": True, "result": result}
+        except Exception as e:
+            logger.error(f"action_batch_server 任务异常: {e!r}")
+            reply = {"ok": False, "error": repr(e)}
+        _reply.write(json_dumps(reply) + "\n")
+
+
+if __name__ == "__main__":
+    serve()
@@ -81,8 +81,7 @@ def create_chrome_driver(task_name, formatted_time, parsers):
 
     # 在当前目录中创建download文件夹
     download_folder = os.path.join(os.getcwd(), 'download')
-    if not os.path.exists(download_folder):
-        os.makedirs(download_folder)
+    os.makedirs(download_folder, exist_ok=True)
 
     os.environ["SE_OFFLINE"] = "true"
     _ACCEPT_LANGUAGE = "zh-CN,zh;q=0.9"
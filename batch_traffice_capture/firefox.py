@@ -9,6 +9,11 @@ import time
 
 from logger import logger
 
+# 折叠“空白行 + 换行”为单个换行；模块加载时编译一次。
+# 开头的先行断言让正则在普通文字位置上第一个字符就失败，不必进入分组回溯（结果与不加时相同）
+WS_NL_RE = re.compile(r'(?=[ \t\f\u00A0\u3000\u200B\u200C\u200D\uFEFF\u2060\u00AD\v\r\n])'
+                      r'(?:[ \t\f\u00A0\u3000\u200B\u200C\u200D\uFEFF\u2060\u00AD\v]*\r?\n)+')
+
 JS_SELECT_ALL_AND_COPY_CAPTURE = r"""
 function __select_all_and_copy_capture(){
   try{
@@ -176,7 +181,7 @@ def open_url_and_save_content(driver, url, ssl_key_file_path):
     res = driver.execute_script(script)
     if not isinstance(res, dict) or res.get("error"):
         raise RuntimeError(f"JS失败: {res}")
-    plain = re.sub(r'(?:[ \t\f\u00A0\u3000\u200B\u200C\u200D\uFEFF\u2060\u00AD\v]*\r?\n)+', '\n', res.get("plain", ""))
+    plain = WS_NL_RE.sub('\n', res.get("plain", ""))
 
     content_path = ssl_key_file_path.replace("_ssl_key.log", ".text").replace("/ssl_key/", "/content/")
     html_path = ssl_key_file_path.replace("_ssl_key.log", ".html").replace("/ssl_key/", "/html/")
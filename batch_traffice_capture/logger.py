@@ -3,8 +3,7 @@ import logging
 import logging.handlers
 import os
 
-# 配置日志基本设置
-def setup_logging():
+def _log_file_path():
     logs_dir = os.path.join(os.getcwd(), "logs")
     os.makedirs(logs_dir, exist_ok=True)
     os.chown(logs_dir, int(os.getenv('HOST_UID')), int(os.getenv('HOST_GID')))
@@ -15,18 +14,30 @@ def setup_logging():
     formatted_time = current_time.strftime("%Y%m%d")
 
     filename = formatted_time + ".log"
+    return os.path.join(logs_dir, filename)
 
-    # 创建一个logger
-    logger = logging.getLogger(filename.split(".")[0])
-    logger.setLevel(logging.DEBUG)  # 可以根据需要设置不同的日志级别
-
-    # 创建一个handler，用于写入日志文件
-    log_file = os.path.join(logs_dir, filename)
-
+def _new_file_handler(log_file):
     # 用于写入日志文件，当文件大小超过100MB时进行滚动
     file_handler = logging.handlers.RotatingFileHandler(log_file, maxBytes=100 * 1024 * 1024, backupCount=3,
                                                         encoding='utf-8')
     file_handler.setLevel(logging.DEBUG)
+    file_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+    return file_handler
+
+_file_handler = None  # 当前写日志文件的 handler，reopen_log_file 会替换它
+
+# 配置日志基本设置
+def setup_logging():
+    global _file_handler
+    # 创建一个handler，用于写入日志文件
+    log_file = _log_file_path()
+
+    # 创建一个logger
+    logger = logging.getLogger(os.path.basename(log_file).split(".")[0])
+    logger.setLevel(logging.DEBUG)  # 可以根据需要设置不同的日志级别
+
+    file_handler = _new_file_handler(log_file)
+    _file_handler = file_handler
 
     # 创建一个handler，用于将日志输出到控制台
     console_handler = logging.StreamHandler()
@@ -36,7 +47,6 @@ def setup_logging():
     # formatter = logging.Formatter
     # ('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
     console_handler.setFormatter(formatter)
 
     # 给logger添加handler
@@ -46,3 +56,24 @@ def setup_logging():
     return logger
 
 logger = setup_logging()
+
+
+def reopen_log_file():
+    """
+    常驻 action server 每个任务开始前调用：日期变了，或宿主机清理目录时把 logs/ 整个删掉了，
+    就换一个新的文件 handler；否则会一直写到启动那天的文件、或已被删除的 inode 上。
+    """
+    global _file_handler
+    log_file = _log_file_path()
+    handler = _file_handler
+    if log_file == handler.baseFilename and handler.stream is not None:
+        try:
+            if os.path.samestat(os.stat(log_file), os.fstat(handler.stream.fileno())):
+                return
+        except FileNotFoundError:
+            pass
+    new_handler = _new_file_handler(log_file)
+    logger.addHandler(new_handler)
+    logger.removeHandler(handler)
+    handler.close()
+    _file_handler = new_handler
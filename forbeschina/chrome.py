@@ -5,6 +5,9 @@ from selenium.webdriver.chrome.service import Service
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 import os
+import tempfile
+
+DEBUG_NETLOG = os.getenv("DEBUG_NETLOG") == "1"  # 为 1 时额外记录 Chrome net-log 和 performance 日志
 
 JS_SELECT_ALL_AND_COPY_CAPTURE = r"""
 function __select_all_and_copy_capture(){
@@ -108,8 +111,13 @@ def create_chrome_driver():
     chrome_options.add_argument("--no-first-run")
     chrome_options.add_argument("--no-default-browser-check")
     chrome_options.add_argument("--homepage=about:blank")
-    chrome_options.add_argument("--log-net-log=/tmp/netlog.json")
-    chrome_options.add_argument("--net-log-capture-mode=Everything")
+    if DEBUG_NETLOG:
+        # 排查问题时才打开：Everything 模式会把每个 socket/DNS/TLS 事件序列化到磁盘；
+        # 多个频道同时跑 Chrome，每个 driver 用自己的文件，避免互相截断同一个文件
+        fd, netlog_path = tempfile.mkstemp(prefix="netlog_", suffix=".json", dir="/tmp")
+        os.close(fd)
+        chrome_options.add_argument(f"--log-net-log={netlog_path}")
+        chrome_options.add_argument("--net-log-capture-mode=Everything")
     # chrome_options.add_argument(f'--proxy-server=http://127.0.0.1:7890')
 
     # 设置实验性首选项
@@ -125,8 +133,9 @@ def create_chrome_driver():
     }
     chrome_options.add_experimental_option("prefs", prefs)
 
-    # 启用性能日志记录
-    chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    # 性能日志（driver 端缓存全部 CDP 事件）同样只在调试时启用，抓取流程没有读取它
+    if DEBUG_NETLOG:
+        chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
 
     # 创建 WebDriver 实例
     service = Service(executable_path="/usr/local/bin/chromedriver")
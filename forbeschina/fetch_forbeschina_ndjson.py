@@ -1,18 +1,41 @@
 #!/usr/bin/env python3
 from __future__ import annotations
+import json
+import os
 import re
 import subprocess
-from typing import List, Dict
+from typing import List, Dict, Set
 from bs4 import BeautifulSoup
-import json
+import soupsieve as sv
 from pathlib import Path
 from typing import Iterable, Mapping, Any
 from chrome import create_chrome_driver
+from concurrent.futures import ThreadPoolExecutor
+import threading
 import time
 
+try:
+    # NDJSON 编解码优先用 orjson（直接产出 UTF-8 bytes）
+    import orjson
+
+    def json_dumps_bytes(obj) -> bytes:
+        return orjson.dumps(obj)
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps_bytes(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    json_loads = json.loads
+
 RATE_LIMIT_SLEEP = 600          # 访问过快时，回退等待的时间（秒）= 10 分钟
 MAX_RATE_LIMIT_RETRY = 10        # 同一页最多回退重试次数
+# 限流页面的特征文案（Selenium 拿不到状态码，只能看页面内容）；命中时直接按限流处理。
+# 这些文案不是从真实的限流响应里取的，文案不同的限流页会落到下面的空页退避
+RATE_LIMIT_MARKERS = ("访问过于频繁", "请求过于频繁", "Too Many Requests")
+MAX_BLANK_PAGES = 3             # 同一页连续这么多次为空才认为频道到头
+BLANK_BACKOFF_BASE = 30         # 空页退避：30s、60s……（不超过 RATE_LIMIT_SLEEP）后重试同一页
 OUT_FILE = 'forbeschina.ndjson'
+MAX_TOTAL_ITEMS = 10000          # 全部频道合计写入上限
+RATE_LIMIT = 1.0                 # 全局请求速率上限（次/秒，所有频道共享）
 url_list = [
     # 创新
     # "https://forbeschina.com/channels/api?action=loadArticles&pn={pn}&path=innovation&code=innovation&cid=",
@@ -45,47 +68,63 @@ url_list = [
     "https://forbeschina.com/channels/api?action=loadArticles&pn={pn}&path=woman&code=woman&cid=",
 ]
 
+# 列表页解析用的选择器 / 正则：模块加载时编译一次，逐块复用
+SEL_BLOCKS_NEW = sv.compile("div.item.new_list")
+SEL_BLOCKS = sv.compile("div.item")
+SEL_INFO = sv.compile("div.info")
+SEL_DATE = sv.compile("p.s")
+SEL_TITLE = sv.compile("h4.title a")
+SEL_DESC = sv.compile("p.desc")
+SEL_AUTHORS = sv.compile("p.s a")
+SEL_IMG = sv.compile("div.imgBox a.img")
+ART_ID_RE = re.compile(r"/(\d+)(?:/)?$")
+AUTHOR_ID_RE = re.compile(r"/author/(\d+)")
+# 背景图的 url('...') 提取
+BG_URL_RE = re.compile(r"url\(\s*['\"]?\s*(?P<u>[^)'\"]+)\s*['\"]?\s*\)", re.IGNORECASE)
+
 # 0 - 21
 def parse_forbeschina_list_html(page_source: str,
                                 domain: str = "www.forbeschina.com") -> List[Dict[str, Any]]:
     """
     从 driver.page_source（ForbesChina 列表页 HTML 片段/页面）中解析文章条目。
-    返回字段：id, section, url, title, desc, author_name, author_url, author_id, date_cn, date_iso, image
+    返回字段：id, url, title, desc, author_name, author_url, author_id, date_cn, date_iso, image
+    id 为文章 URL 末尾的整数 ID，每条必有，是写入去重的唯一依据（见 append_ndjson）。
 
     用法：
         html = driver.page_source
         items = parse_forbeschina_list_html(html)
-        # 写 NDJSON:
-        # import json
-        # print("\n".join(json.dumps(x, ensure_ascii=False) for x in items))
+        # 写 NDJSON（按 id 去重追加）:
+        # append_ndjson(items, OUT_FILE)
     """
     soup = BeautifulSoup(page_source, "html.parser")
-    blocks = soup.select("div.item.new_list") or soup.select("div.item")
-
-    # 背景图的 url('...') 提取
-    bg_url_re = re.compile(r"url\(\s*['\"]?\s*(?P<u>[^)'\"]+)\s*['\"]?\s*\)", re.IGNORECASE)
+    blocks = SEL_BLOCKS_NEW.select(soup) or SEL_BLOCKS.select(soup)
 
     out: List[Dict[str, Any]] = []
 
     for b in blocks:
         try:
-            info = b.select_one("div.info")
+            info = SEL_INFO.select_one(b)
             if not info:
                 continue
 
             # 日期：如 2025年10月15日
-            date_cn = (info.select_one("p.s") or {}).get_text(strip=True)
-            m = re.match(r"^\s*(\d{4})年(\d{2})月(\d{2})日\s*$", date_cn or "")
-            date_iso = f"{m.group(1)}-{m.group(2)}-{m.group(3)}" if m else ""
+            date_cn = (SEL_DATE.select_one(info) or {}).get_text(strip=True)
+            # 固定格式 YYYY年MM月DD日，直接按位置切片，不走正则
+            d = (date_cn or "").strip()
+            if (len(d) == 11 and d[4] == "年" and d[7] == "月" and d[10] == "日"
+                    and (d[:4] + d[5:7] + d[8:10]).isdigit()):
+                date_iso = f"{d[:4]}-{d[5:7]}-{d[8:10]}"
+            else:
+                date_iso = ""
 
             # 标题/详情链接
-            a_title = info.select_one("h4.title a")
+            a_title = SEL_TITLE.select_one(info)
             if not a_title:
                 continue
             title = a_title.get_text(strip=True)
             href = (a_title.get("href") or "").strip()
             # 文章 ID：/leadership/70498
-            mid = re.search(r"/(\d+)(?:/)?$", href)
+            mid = ART_ID_RE.search(href)
             if not mid:
                 continue
             art_id = int(mid.group(1))
@@ -94,25 +133,25 @@ def parse_forbeschina_list_html(page_source: str,
             url = href if href.startswith(("http://", "https://")) else f"https://{domain}{href if href.startswith('/') else '/' + href}"
 
             # 描述
-            desc = (info.select_one("p.desc") or {}).get_text(strip=True)
+            desc = (SEL_DESC.select_one(info) or {}).get_text(strip=True)
 
             # 作者（通常在<p class="s">里最后一个<a>）
             author_name, author_url, author_id = "", "", None
-            a_list = info.select("p.s a")
+            a_list = SEL_AUTHORS.select(info)
             if a_list:
                 a_author = a_list[-1]
                 author_name = a_author.get_text(strip=True)
                 au_href = (a_author.get("href") or "").strip()
                 author_url = au_href if au_href.startswith(("http://", "https://")) else f"https://{domain}{au_href if au_href.startswith('/') else '/' + au_href}"
-                m2 = re.search(r"/author/(\d+)", au_href)
+                m2 = AUTHOR_ID_RE.search(au_href)
                 author_id = int(m2.group(1)) if m2 else None
 
             # 图片（background-image: url(' ... ');）
             image = None
-            a_img = b.select_one("div.imgBox a.img")
+            a_img = SEL_IMG.select_one(b)
             if a_img:
                 style = a_img.get("style", "")
-                m3 = bg_url_re.search(style)
+                m3 = BG_URL_RE.search(style)
                 if m3:
                     image = m3.group("u").strip()
 
@@ -134,31 +173,63 @@ def parse_forbeschina_list_html(page_source: str,
 
     return out
 
+# 已写入文章 id 的进程内缓存：每个输出文件只在首次追加时加载一次
+_seen_ids: Dict[Path, Set[int]] = {}
+
+def load_seen_ids(path: Path) -> Set[int]:
+    """
+    读取 path 对应的已写入 id 集合。
+    优先读旁路文件 <out>.ids（每行一个 id）；不存在时从 NDJSON 重建一次并写出。
+    """
+    if path in _seen_ids:
+        return _seen_ids[path]
+
+    ids_path = path.with_suffix(".ids")
+    seen: Set[int] = set()
+    if ids_path.exists():
+        seen = {int(x) for x in ids_path.read_text(encoding="utf-8").split()}
+    elif path.exists():
+        with path.open("rb") as f:
+            for raw in f:
+                try:
+                    seen.add(int(json_loads(raw)["id"]))
+                except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                    continue
+        ids_path.write_text("".join(f"{i}\n" for i in sorted(seen)), encoding="utf-8")
+
+    _seen_ids[path] = seen
+    return seen
+
 def append_ndjson(items: Iterable[Mapping[str, Any]], out_file: str | Path) -> int:
     """
-    将 items（字典列表）追加写入到 NDJSON 文件。
+    将 items（字典列表）追加写入到 NDJSON 文件，按 id 去重：
+    只比较 id，不比较序列化后的行，序列化格式变化不会导致重复写入。
+    新 id 同步追加到旁路文件 <out>.ids。
     返回成功写入的条数。
     """
     path = Path(out_file)
     path.parent.mkdir(parents=True, exist_ok=True)
-
-    # 如果文件还不存在，seen 设为空集合
-    if path.exists():
-        with path.open("r", encoding="utf-8") as f:
-            seen = set(f.readlines())
-    else:
-        seen = set()
-
-    n = 0
-    with path.open("a", encoding="utf-8") as f:
-        for obj in items:
-            line = json.dumps(dict(obj), ensure_ascii=False) + "\n"
-            if line in seen:
-                continue
-            f.write(line)
-            seen.add(line)
-            n += 1
-    return n
+    seen = load_seen_ids(path)
+
+    # 整页新记录先在内存里攒好，一次 write + fsync
+    batch = []
+    new_ids = []
+    for obj in items:
+        art_id = obj["id"]
+        if art_id in seen:
+            continue
+        batch.append(json_dumps_bytes(dict(obj)) + b"\n")
+        seen.add(art_id)
+        new_ids.append(art_id)
+    if batch:
+        with path.open("ab") as f:
+            f.write(b"".join(batch))
+            f.flush()
+            os.fsync(f.fileno())
+        # 主文件落盘后再记 id，崩溃时最多重复写当前页，不会漏写
+        with path.with_suffix(".ids").open("a", encoding="utf-8") as f:
+            f.write("".join(f"{i}\n" for i in new_ids))
+    return len(batch)
 
 
 # 清除浏览器进程
@@ -170,69 +241,103 @@ def kill_chrome_processes():
     except subprocess.CalledProcessError as e:
         print(f"Error occurred: {e.stderr.decode('utf-8')}")
 
-kill_chrome_processes()
-driver = create_chrome_driver()
-pn = 0
-blank_count = 0
+class TokenBucket:
+    """线程安全的令牌桶：所有频道 worker 共享，整体请求速率不超过 rate 次/秒。"""
+    def __init__(self, rate: float = RATE_LIMIT, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_write_lock = threading.Lock()   # 串行化 NDJSON 追加与计数
+_stop = threading.Event()        # 达到 MAX_TOTAL_ITEMS 时通知所有频道停止
 url_num = 0
-for tmpl in url_list:
+
+
+def channel_worker(tmpl: str, bucket: TokenBucket) -> None:
+    """单个频道的抓取状态机：自己的 driver、pn 计数和限流重试，互不阻塞。"""
+    global url_num
+    driver = create_chrome_driver()
     pn = 0
     blank_count = 0
     rate_limit_retry = 0        # 当前频道的“访问过快”重试计数
 
-    while True:
-        pn += 1
-        url = tmpl.format(pn=pn)
-        print(f"[INFO] Fetching: {url}")
-
-        driver.get(url)
-        html = driver.page_source
-        text = html.strip()
-
-        # 1）空页处理：连续 3 页几乎没内容就认为这个频道到头了
-        if len(text) < 100:
-            blank_count += 1
-            print(f"[WARN] blank page #{blank_count} for {url}")
-            if blank_count >= 3:
-                print(f"[INFO] too many blank pages, stop this channel, tmpl={tmpl}")
-                pn = 0
-                break
-            # 空页也稍微等一下，避免太狂暴
-            time.sleep(3)
-            continue
-        else:
-            blank_count = 0
-
-        # 2）这里可以根据页面内容判断“访问过快”，如果你发现有固定提示文案可以加进去
-        # 例如：if "访问过于频繁" in text 或 "Too Many Requests" in text 之类
-        # 下面先用“解析结果为空”来当作访问过快的信号
+    try:
+        while not _stop.is_set():
+            pn += 1
+            url = tmpl.format(pn=pn)
+            print(f"[INFO] Fetching: {url}")
+
+            bucket.acquire()
+            driver.get(url)
+            html = driver.page_source
+            text = html.strip()
+
+            # 1）根据页面特征文案判断“访问过快”，命中就按限流回退等待
+            items = parse_forbeschina_list_html(html) if len(text) >= 100 else []
+            rate_limited = not items and any(marker in text for marker in RATE_LIMIT_MARKERS)
+
+            # 2）空页（几乎没内容或解析不出条目）且没有已知限流文案：可能是频道到头，也可能是文案
+            # 不同的限流页。先按有上限的指数退避重试同一页，连续 MAX_BLANK_PAGES 次仍为空才结束频道
+            if not items and not rate_limited:
+                blank_count += 1
+                print(f"[WARN] blank page #{blank_count} for {url}")
+                if blank_count >= MAX_BLANK_PAGES:
+                    print(f"[INFO] too many blank pages, stop this channel, tmpl={tmpl}")
+                    break
+                wait = min(RATE_LIMIT_SLEEP, BLANK_BACKOFF_BASE * 2 ** (blank_count - 1))
+                print(f"[INFO] back off {wait}s and retry pn={pn}")
+                pn -= 1
+                _stop.wait(wait)
+                continue
 
-        items = parse_forbeschina_list_html(html)
+            # 被限流：回退并等待 10 分钟后重试同一页（只阻塞本频道）
+            if rate_limited:
+                rate_limit_retry += 1
+                print(f"[WARN] rate limited at pn={pn}. "
+                      f"retry={rate_limit_retry}/{MAX_RATE_LIMIT_RETRY}, sleep {RATE_LIMIT_SLEEP}s")
 
-        # 解析结果为空：认为可能是访问过快 / 被限流，回退并等待 10 分钟后重试同一页
-        if not items:
-            rate_limit_retry += 1
-            print(f"[WARN] no items parsed for pn={pn}, maybe rate limited. "
-                  f"retry={rate_limit_retry}/{MAX_RATE_LIMIT_RETRY}, sleep {RATE_LIMIT_SLEEP}s")
+                # 回退 pn，让下一轮 while 还是访问同一页
+                pn -= 1
 
-            # 回退 pn，让下一轮 while 还是访问同一页
-            pn -= 1
+                # 超过最大重试次数就放弃这个频道，避免死循环
+                if rate_limit_retry >= MAX_RATE_LIMIT_RETRY:
+                    print(f"[INFO] reach max rate-limit retry for tmpl={tmpl}, stop this channel")
+                    break
 
-            # 超过最大重试次数就放弃这个频道，避免死循环
-            if rate_limit_retry >= MAX_RATE_LIMIT_RETRY:
-                print(f"[INFO] reach max rate-limit retry for tmpl={tmpl}, stop this channel")
-                pn = 0
-                break
+                _stop.wait(RATE_LIMIT_SLEEP)
+                continue
 
-            time.sleep(RATE_LIMIT_SLEEP)
-            continue
+            # 有正常数据，重置空页与“访问过快”计数
+            blank_count = 0
+            rate_limit_retry = 0
+            with _write_lock:
+                new_n = append_ndjson(items, OUT_FILE)
+                url_num += new_n
+                print(f"[INFO] wrote {new_n} new items to {OUT_FILE}")
+                if url_num >= MAX_TOTAL_ITEMS:
+                    print(f"[INFO] reached total {url_num} items, exiting.")
+                    _stop.set()
+    finally:
+        driver.quit()
 
-        # 有正常数据，重置“访问过快”计数
-        rate_limit_retry = 0
-        new_n = append_ndjson(items, OUT_FILE)
-        print(f"[INFO] wrote {new_n} new items to {OUT_FILE}")
-        url_num += new_n
 
-    if url_num >= 10000:
-        print(f"[INFO] reached total {url_num} items, exiting.")
-        break
+kill_chrome_processes()
+bucket = TokenBucket()
+with ThreadPoolExecutor(max_workers=len(url_list)) as pool:
+    for fut in [pool.submit(channel_worker, tmpl, bucket) for tmpl in url_list]:
+        fut.result()
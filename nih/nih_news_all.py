@@ -12,16 +12,31 @@ NIH News Releases 全量抓取（无命令行参数版）
 from __future__ import annotations
 import json
 import os
-import random
 import re
+import threading
 import time
-from dataclasses import dataclass, asdict
-from datetime import datetime
-from typing import Optional, List, Dict, Set
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import date
+from typing import Any, BinaryIO, Dict, Optional, List, Set, Tuple
 from urllib.parse import urljoin, urlparse
 
 import requests
 from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    # NDJSON 编解码优先用 orjson（直接产出 UTF-8 bytes）
+    import orjson
+
+    def json_dumps_bytes(obj) -> bytes:
+        return orjson.dumps(obj)
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps_bytes(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    json_loads = json.loads
 
 # =========================
 # 全局配置（按需修改）
@@ -30,7 +45,9 @@ OUTPUT_PATH: str = "nih.ndjson"   # 固定输出文件（NDJSON / JSONL）
 START_PAGE: int = 0               # 从第 0 页开始（0 即第一页）
 MAX_PAGES: Optional[int] = None   # 最多抓多少页；None 表示不设上限
 STOP_AFTER_EMPTY: int = 3         # 连续空页阈值（越界或全重复时停止）
-SLEEP_BASE: float = 0.8           # 每次请求基础 sleep（温和抓取）
+RATE_LIMIT: float = 1.25          # 全局请求速率上限（次/秒，所有线程共享，温和抓取）
+CONCURRENCY: int = 8              # 并发抓取线程数
+WINDOW: int = 16                  # 每批并发抓取的页数（批次结束后统一判断停止条件）
 TIMEOUT: float = 20.0             # HTTP 超时（秒）
 RETRIES: int = 3                  # 失败重试次数
 BACKOFF: float = 1.6              # 指数退避系数
@@ -44,52 +61,64 @@ LIST_URL = f"{BASE}/news-events/nih-research-matters"
 UA = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
       "(KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36")
 DATE_PAT = re.compile(r"([A-Za-z]+ \d{1,2}, \d{4})")
+MONTHS = {name: i for i, name in enumerate(
+    ("January", "February", "March", "April", "May", "June", "July",
+     "August", "September", "October", "November", "December"), start=1)}
+# load_seen_urls 快速路径：直接从行里取 url 字段（不含转义字符时）
+URL_FIELD_PAT = re.compile(rb'"url":\s*"([^"\\]+)"')
 DASH = "—"  # em-dash，列表页常用“ — ”分隔摘要
 
 # =========================
-# 数据结构
+# 限速（令牌桶，线程共享）
 # =========================
-@dataclass
-class NewsItem:
-    title: str
-    date_str: str
-    date_iso: Optional[str]
-    summary: Optional[str]
-    url: str
-    page_index: int
+class TokenBucket:
+    def __init__(self, rate: float = RATE_LIMIT, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """阻塞直到拿到一个令牌；保证所有线程合计不超过 rate 次/秒。"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
 
 # =========================
 # HTTP 封装（温和 + 重试）
 # =========================
 class Http:
     def __init__(self, timeout: float = TIMEOUT, retries: int = RETRIES,
-                 backoff: float = BACKOFF, sleep_base: float = SLEEP_BASE):
+                 backoff: float = BACKOFF, bucket: Optional[TokenBucket] = None):
         self.sess = requests.Session()
         self.sess.headers.update({"User-Agent": UA, "Accept-Language": "en-US,en;q=0.9"})
+        # 重试交给 urllib3：连接池复用 keep-alive/TLS，429 时遵循 Retry-After
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff - 1,
+            status_forcelist=(403, 429, 500, 502, 503, 504),
+            allowed_methods=("GET",),
+            respect_retry_after_header=True,
+            raise_on_status=False,  # 重试耗尽后返回最后一次响应，由调用方按状态码处理
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retry)
+        self.sess.mount("https://", adapter)
+        self.sess.mount("http://", adapter)
         self.timeout = timeout
-        self.retries = retries
-        self.backoff = backoff
-        self.sleep_base = sleep_base
+        self.bucket = bucket or TokenBucket()
 
     def get(self, url: str, params: dict | None = None) -> requests.Response:
-        # 基础延时，避免给对方带来压力
-        time.sleep(self.sleep_base + random.random() * 0.4)
-        last_exc = None
-        for i in range(self.retries):
-            try:
-                r = self.sess.get(url, params=params, timeout=self.timeout)
-                if r.status_code in (200, 404):
-                    return r
-                if r.status_code in (429, 500, 502, 503, 504, 403):
-                    time.sleep((self.backoff ** i) + random.random())
-                    continue
-                return r
-            except requests.RequestException as e:
-                last_exc = e
-                time.sleep((self.backoff ** i) + random.random())
-        if last_exc:
-            raise last_exc
-        raise RuntimeError("HTTP unexpected flow")
+        # 全局限速，避免给对方带来压力
+        self.bucket.acquire()
+        return self.sess.get(url, params=params, timeout=self.timeout)
 
 # =========================
 # 工具函数
@@ -97,41 +126,62 @@ class Http:
 def normalize_ws(s: str) -> str:
     return re.sub(r"\s+", " ", s).strip()
 
+def parse_en_date(s: str) -> Optional[str]:
+    """"September 30, 2025" -> "2025-09-30"；等价于 strptime("%B %d, %Y")，失败返回 None。"""
+    try:
+        mo, rest = s.split(" ", 1)
+        d, y = rest.split(", ")
+        return date(int(y), MONTHS[mo.capitalize()], int(d)).isoformat()
+    except (KeyError, ValueError):
+        return None
+
 def load_seen_urls(path: str) -> Set[str]:
     """从 NDJSON 读取已抓 URL，支持断点续跑。"""
     seen: Set[str] = set()
     if not os.path.exists(path):
         return seen
-    with open(path, "r", encoding="utf-8") as f:
+    with open(path, "rb") as f:
         for line in f:
+            m = URL_FIELD_PAT.search(line)
+            if m:
+                seen.add(m.group(1).decode("utf-8"))
+                continue
+            # 回退：url 含转义或格式不标准时再完整解析
             line = line.strip()
             if not line:
                 continue
             try:
-                obj = json.loads(line)
+                obj = json_loads(line)
                 url = obj.get("url")
                 if url:
                     seen.add(url)
-            except Exception:
+            except (json.JSONDecodeError, AttributeError):  # orjson.JSONDecodeError 是其子类
                 # 跳过坏行
                 continue
     return seen
 
-def write_ndjson(path: str, obj: dict) -> None:
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+def write_ndjson(f: BinaryIO, objs: List[dict]) -> None:
+    """整页记录拼成一次 write 并 fsync：断点续跑以页为粒度，崩溃最多丢当前页。"""
+    if not objs:
+        return
+    f.write(b"".join(json_dumps_bytes(obj) + b"\n" for obj in objs))
+    f.flush()
+    os.fsync(f.fileno())
 
 # =========================
 # 解析列表页
 # =========================
-def parse_list_items(html: str, page_index: int) -> List[NewsItem]:
+def parse_list_items(html: str, page_index: int) -> List[Dict[str, Any]]:
     """
     列表页单条新闻通常呈现为：
     "<Title> <Month DD, YYYY> — <Summary>"
     这里不依赖特定 CSS 类，直接根据“日期 + em-dash”做稳健解析。
+    记录直接以 dict 产出（字段：title / date_str / date_iso / summary / url / page_index），
+    可原样写入 NDJSON。
     """
     soup = BeautifulSoup(html, "html.parser")
-    items: List[NewsItem] = []
+    items: List[Dict[str, Any]] = []
+    seen_on_page: Set[str] = set()  # 同页按 URL 去重（保留首条）
 
     for a in soup.find_all("a", href=True):
         href = a["href"]
@@ -143,6 +193,8 @@ def parse_list_items(html: str, page_index: int) -> List[NewsItem]:
         # 仅保留 /news-events/nih-research-matters/xxx 详情页链接
         if not parsed.path.startswith("/news-events/nih-research-matters/"):
             continue
+        if href in seen_on_page:
+            continue
 
         text = normalize_ws(a.get_text(" ").strip())
         m = DATE_PAT.search(text)
@@ -151,10 +203,7 @@ def parse_list_items(html: str, page_index: int) -> List[NewsItem]:
             continue
 
         date_str = m.group(1)
-        try:
-            date_iso = datetime.strptime(date_str, "%B %d, %Y").date().isoformat()
-        except Exception:
-            date_iso = None
+        date_iso = parse_en_date(date_str)
 
         # 按 em-dash 分隔摘要
         summary = None
@@ -167,74 +216,85 @@ def parse_list_items(html: str, page_index: int) -> List[NewsItem]:
 
         title = title.rstrip(" -—:;").strip()
 
-        items.append(NewsItem(
-            title=title,
-            date_str=date_str,
-            date_iso=date_iso,
-            summary=summary,
-            url=href,
-            page_index=page_index
-        ))
+        items.append({
+            "title": title,
+            "date_str": date_str,
+            "date_iso": date_iso,
+            "summary": summary,
+            "url": href,
+            "page_index": page_index,
+        })
+        seen_on_page.add(href)
 
-    # 同页按 URL 去重
-    uniq: Dict[str, NewsItem] = {}
-    for it in items:
-        if it.url not in uniq:
-            uniq[it.url] = it
-    return list(uniq.values())
+    return items
 
 # =========================
 # 主抓取流程
 # =========================
+def fetch_page(http: Http, page: int) -> Tuple[int, int, List[Dict[str, Any]]]:
+    """抓取并解析单页，返回 (page, status_code, items)；在线程池中执行。"""
+    list_url = LIST_URL if page == 0 else f"{LIST_URL}?page={page}"
+    r = http.get(list_url)
+    if r.status_code != 200:
+        return page, r.status_code, []
+    return page, r.status_code, parse_list_items(r.text, page_index=page)
+
 def crawl_all() -> None:
     http = Http()
     seen = load_seen_urls(OUTPUT_PATH)
     total_new = 0
     page = START_PAGE
     empty_pages = 0
+    end_page = START_PAGE + MAX_PAGES if MAX_PAGES is not None else None
 
     os.makedirs(os.path.dirname(os.path.abspath(OUTPUT_PATH)) or ".", exist_ok=True)
 
-    while True:
-        list_url = LIST_URL if page == 0 else f"{LIST_URL}?page={page}"
-        r = http.get(list_url)
+    # 输出文件整个抓取过程只打开一次；DRY_RUN 时不打开
+    out_cm = nullcontext() if DRY_RUN else open(OUTPUT_PATH, "ab", buffering=1 << 16)
+    with out_cm as f_out, ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        done = False
+        while not done:
+            # 一个窗口内并发抓取，结果按页序在主线程中合并、写入
+            window_end = page + WINDOW if end_page is None else min(page + WINDOW, end_page)
+            results = pool.map(lambda p: fetch_page(http, p), range(page, window_end))
 
-        if r.status_code == 404:
-            print(f"[{page}] 404（越界）。结束。")
-            break
+            for page, status, items in results:
+                if status == 404:
+                    print(f"[{page}] 404（越界）。结束。")
+                    done = True
+                    break
 
-        if r.status_code != 200:
-            print(f"[{page}] HTTP {r.status_code}，跳过并继续。")
-            page += 1
-            continue
+                if status != 200:
+                    print(f"[{page}] HTTP {status}，跳过并继续。")
+                    continue
 
-        items = parse_list_items(r.text, page_index=page)
-        new_items = [it for it in items if it.url not in seen]
+                new_items = [it for it in items if it["url"] not in seen]
 
-        print(f"[{page}] 提取 {len(items)} 条；新 {len(new_items)} 条；累计新 {total_new}。")
+                print(f"[{page}] 提取 {len(items)} 条；新 {len(new_items)} 条；累计新 {total_new}。")
 
-        if not new_items:
-            empty_pages += 1
-        else:
-            empty_pages = 0
-
-        for it in new_items:
-            rec = asdict(it)
-            if not DRY_RUN:
-                write_ndjson(OUTPUT_PATH, rec)
-            seen.add(it.url)
-            total_new += 1
-
-        page += 1
-
-        # 停止条件 1：达到上限页
-        if MAX_PAGES is not None and page >= START_PAGE + MAX_PAGES:
-            print(f"达到 MAX_PAGES={MAX_PAGES}，结束。")
-            break
-        # 停止条件 2：连续空页（越过最后一页或全重复）
-        if empty_pages >= STOP_AFTER_EMPTY:
-            print(f"连续空页 {empty_pages} 次（可能已越过最后有效页）。结束。")
-            break
+                if not new_items:
+                    empty_pages += 1
+                else:
+                    empty_pages = 0
+
+                if f_out is not None:
+                    write_ndjson(f_out, new_items)
+                for it in new_items:
+                    seen.add(it["url"])
+                total_new += len(new_items)
+
+                # 停止条件：连续空页（越过最后一页或全重复）
+                if empty_pages >= STOP_AFTER_EMPTY:
+                    print(f"连续空页 {empty_pages} 次（可能已越过最后有效页）。结束。")
+                    done = True
+                    break
+
+            page = window_end
+
+            # 停止条件：达到上限页
+            if not done and end_page is not None and page >= end_page:
+                print(f"达到 MAX_PAGES={MAX_PAGES}，结束。")
+                done = True
 
     print(f"完成：新增 {total_new} 条。输出文件：{OUTPUT_PATH}（DRY_RUN={DRY_RUN}）")
 
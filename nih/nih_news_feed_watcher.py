@@ -11,19 +11,40 @@ NIH News Releases RSS/Atom 订阅抓取（持续运行 + 与 nih.ndjson 去重
 """
 
 from __future__ import annotations
+import atexit
+import io
 import json
 import os
 import random
 import re
 import time
 from datetime import datetime, timezone
-from typing import List, Dict, Optional, Set
-from urllib.parse import urljoin
+from typing import Iterator, List, Dict, Optional, Set, Tuple
 
 import requests
-import xml.etree.ElementTree as ET
+from requests.adapters import HTTPAdapter
 from email.utils import parsedate_to_datetime
 
+try:
+    # 优先用 lxml 的 C 解析器；不解析实体、不放开超大树
+    from lxml import etree as ET
+    ITERPARSE_KW: Dict = {"resolve_entities": False, "huge_tree": False}
+except ImportError:
+    import xml.etree.ElementTree as ET
+    ITERPARSE_KW = {}
+
+try:
+    # NDJSON 编解码优先用 orjson（直接产出 UTF-8 bytes）
+    import orjson
+
+    def json_dumps_bytes(obj) -> bytes:
+        return orjson.dumps(obj)
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps_bytes(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+    json_loads = json.loads
+
 # =============== 全局配置（按需修改） ===============
 FEED_URL: str = "https://www.nih.gov/news-releases/feed.xml"
 OUTPUT_PATH: str = "nih.ndjson"     # 与站点抓取脚本保持一致
@@ -36,6 +57,15 @@ DRY_RUN: bool = False               # 演练模式，不写文件
 
 # =============== 常量 ===============
 BASE = "https://www.nih.gov"
+WS_RE = re.compile(r"\s+")
+BR_RE = re.compile(r"<br\s*/?>", re.I)
+TAG_RE = re.compile(r"<[^>]+>")
+# feed 解析：按本地名（去掉 {ns} 前缀）分派
+ITEM_TAGS = frozenset(("item", "entry"))
+# 摘要字段优先级：RSS item 看 description，Atom entry 的摘要可能在 <summary> 或 <content>
+DESC_TAGS = {"item": ("description", "content", "summary"), "entry": ("summary", "content")}
+FIELD_TAGS = frozenset(("title", "link", "pubDate", "updated", "published",
+                        "description", "content", "summary"))
 UA = ("Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
       "(KHTML, like Gecko) Chrome/119.0.0.0 Safari/537.36")
 
@@ -44,41 +74,101 @@ def ts() -> str:
     return time.strftime("%Y-%m-%d %H:%M:%S")
 
 def normalize_ws(s: str) -> str:
-    return re.sub(r"\s+", " ", s or "").strip()
+    return WS_RE.sub(" ", s).strip() if s else ""
 
 def strip_html(s: str) -> str:
     if not s:
         return ""
     # 非严格 HTML 去标签，足够应对常见 <p>, <br>, <em> 等
-    s = re.sub(r"<br\s*/?>", " ", s, flags=re.I)
-    s = re.sub(r"<[^>]+>", " ", s)
+    s = BR_RE.sub(" ", s)
+    s = TAG_RE.sub(" ", s)
     return normalize_ws(s)
 
-def load_seen_urls(path: str) -> Set[str]:
-    seen: Set[str] = set()
+def _extract_url(line: bytes) -> Optional[str]:
+    """直接切出 "url": "..." 的值（冒号后空格可有可无）；值里有转义时返回 None，交给完整解析。"""
+    i = line.rfind(b'"url":')
+    if i < 0:
+        return None
+    i += 6
+    if line[i:i + 1] == b" ":
+        i += 1
+    if line[i:i + 1] != b'"':
+        return None
+    i += 1
+    j = line.find(b'"', i)
+    if j < 0:
+        return None
+    url = line[i:j]
+    return None if b"\\" in url else url.decode("utf-8")
+
+def iter_ndjson_urls(path: str) -> Iterator[str]:
+    """逐行流式产出 NDJSON 中的 url，不在内存里保留历史。"""
     if not os.path.exists(path):
-        return seen
-    with open(path, "r", encoding="utf-8") as f:
+        return
+    with open(path, "rb") as f:
         for line in f:
-            line = line.strip()
-            if not line:
+            if b'"url":' not in line:
+                continue
+            url = _extract_url(line)
+            if url:
+                yield url
                 continue
             try:
-                obj = json.loads(line)
-                url = obj.get("url")
-                if url:
-                    seen.add(url)
+                url = json_loads(line).get("url")
             except Exception:
                 continue
-    return seen
+            if url:
+                yield url
+
+def filter_new_records(path: str, records: List[Dict]) -> List[Dict]:
+    """只保留 url 不在 NDJSON 中的记录；集合大小只与本次 feed 相关。"""
+    candidate_urls = {rec["url"] for rec in records}
+    for url in iter_ndjson_urls(path):
+        candidate_urls.discard(url)
+        if not candidate_urls:
+            break
+    return [rec for rec in records if rec["url"] in candidate_urls]
 
-def write_ndjson(path: str, obj: dict) -> None:
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
+# 输出文件的 O_APPEND 描述符：进程内只打开一次，退出时关闭
+_OUT_FDS: Dict[str, int] = {}
+
+def _close_out_fds() -> None:
+    for fd in _OUT_FDS.values():
+        os.close(fd)
+    _OUT_FDS.clear()
+
+atexit.register(_close_out_fds)
+
+def write_ndjson(path: str, objs: List[dict]) -> None:
+    """
+    整批记录拼成一次 os.write 追加，结束时 fsync 一次。
+    O_APPEND 由内核保证每次 write 都追加到文件末尾，与站点抓取脚本同时写 nih.ndjson 也不会互相覆盖。
+    """
+    if not objs:
+        return
+    fd = _OUT_FDS.get(path)
+    if fd is None:
+        fd = _OUT_FDS[path] = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    buf = memoryview(b"".join(json_dumps_bytes(obj) + b"\n" for obj in objs))
+    while buf:
+        buf = buf[os.write(fd, buf):]
+    os.fsync(fd)
 
-def http_get_with_retries(url: str) -> Optional[str]:
+def _make_session() -> requests.Session:
     sess = requests.Session()
     sess.headers.update({"User-Agent": UA, "Accept": "application/rss+xml, application/xml;q=0.9,*/*;q=0.8"})
+    # 重试仍由 http_get_with_retries 自己控制
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=0)
+    sess.mount("https://", adapter)
+    sess.mount("http://", adapter)
+    return sess
+
+# 进程内复用同一个 Session，多次轮询之间保持 keep-alive，省去重复的 TCP/TLS 握手
+SESSION = _make_session()
+
+def http_get_with_retries(url: str) -> Tuple[Optional[bytes], str]:
+    """返回 (body, content_type)；最终失败时 body 为 None。"""
+    sess = SESSION
     last_exc = None
     for i in range(RETRIES):
         try:
@@ -86,183 +176,157 @@ def http_get_with_retries(url: str) -> Optional[str]:
             time.sleep(0.6 + random.random() * SLEEP_JITTER)
             r = sess.get(url, timeout=TIMEOUT)
             if r.status_code == 200:
-                return r.text
+                return r.content, r.headers.get("content-type", "")
             if r.status_code in (429, 500, 502, 503, 504, 403):
                 time.sleep((BACKOFF ** i) + random.random())
                 continue
-            # 其它状态也直接返回文本（可能是 301/302 HTML），交给解析处理
-            return r.text
+            # 其它状态也直接返回内容（可能是 301/302 HTML），由 looks_like_feed 判断是否解析
+            return r.content, r.headers.get("content-type", "")
         except requests.RequestException as e:
             last_exc = e
             time.sleep((BACKOFF ** i) + random.random())
     # 最终失败
     if last_exc:
         print(f"[{ts()}] ERROR http_get: {last_exc}")
-    return None
+    return None, ""
+
+def looks_like_feed(data: bytes, content_type: str) -> bool:
+    """按 Content-Type 或开头字节判断是否 XML feed，HTML 中间页直接跳过，不去解析。"""
+    if "xml" in content_type.lower():
+        return True
+    head = data[:256].lstrip(b"\xef\xbb\xbf \t\r\n")
+    return head.startswith((b"<?xml", b"<rss", b"<feed"))
 
 # =============== XML 解析（兼容 RSS 与 Atom） ===============
-def _find_text_any(elem: ET.Element, tags: List[str]) -> Optional[str]:
-    """在任意命名空间下查找首个匹配文本，例如 tags=['title','{*}title']"""
-    for tag in tags:
-        # 先尝试无命名空间
-        t = elem.find(tag)
-        if t is not None and t.text:
-            return t.text
-        # 再尝试通配命名空间
-        t = elem.find(f".//{{*}}{tag}")
-        if t is not None and t.text:
-            return t.text
-    return None
+def _localname(tag) -> str:
+    return tag.rpartition("}")[2] if isinstance(tag, str) else ""
 
-def _find_link(elem: ET.Element) -> Optional[str]:
-    """
-    RSS: <link>http...</link>
-    Atom: <link href="http..." rel="alternate"/>
-    """
-    # RSS 形式
-    val = _find_text_any(elem, ["link"])
-    if val and val.strip():
-        return val.strip()
-    # Atom 形式
-    for link in elem.findall(".//{*}link"):
-        href = link.attrib.get("href")
-        if href:
-            # 若有 rel="alternate" 优先
-            rel = link.attrib.get("rel", "")
-            if rel in ("alternate", "", None):
-                return href
-    return None
+def _parse_iso(raw: str) -> datetime:
+    # 允许结尾 'Z'
+    return datetime.fromisoformat(raw[:-1] + "+00:00" if raw.endswith("Z") else raw)
 
-def _find_pub_date(elem: ET.Element) -> (str, Optional[str]):
+def _parse_pub_date(raw: Optional[str]) -> Tuple[str, Optional[str]]:
     """
     返回: (date_str, date_iso)
     RSS 常见: <pubDate>Tue, 15 Oct 2024 12:34:56 GMT</pubDate>
     Atom 常见: <updated>2024-10-15T12:34:56Z</updated> / <published>...</published>
     """
-    raw = _find_text_any(elem, ["pubDate", "updated", "published"])
     if not raw:
         return ("", None)
 
     raw = raw.strip()
-    # 先尝试 RFC822
-    try:
-        dt = parsedate_to_datetime(raw)
+    # ISO 8601（Atom）以 4 位年份 + "-" 开头；RFC822（RSS）以星期/日期开头。
+    # 先按首字符分派，避免主路径上先抛一次异常
+    if len(raw) >= 5 and raw[4] == "-" and raw[:4].isdigit():
+        parsers = (_parse_iso, parsedate_to_datetime)
+    else:
+        parsers = (parsedate_to_datetime, _parse_iso)
+
+    for parse in parsers:
+        try:
+            dt = parse(raw)
+        except (TypeError, ValueError):
+            continue
         if dt.tzinfo is None:
             dt = dt.replace(tzinfo=timezone.utc)
         date_iso = dt.date().isoformat()
         # 友好的英文月日格式
         date_str = dt.strftime("%B %d, %Y")
         return (date_str, date_iso)
-    except Exception:
-        pass
+    return (raw, None)
 
-    # 再尝试 ISO 8601（Atom）
-    try:
-        # 允许结尾 'Z'
-        if raw.endswith("Z"):
-            raw2 = raw.replace("Z", "+00:00")
-        else:
-            raw2 = raw
-        dt = datetime.fromisoformat(raw2)
-        if dt.tzinfo is None:
-            dt = dt.replace(tzinfo=timezone.utc)
-        date_iso = dt.date().isoformat()
-        date_str = dt.strftime("%B %d, %Y")
-        return (date_str, date_iso)
-    except Exception:
-        return (raw, None)
+def _first(fields: Dict[str, str], names: Tuple[str, ...]) -> Optional[str]:
+    """按优先级取第一个有文本的字段。"""
+    for name in names:
+        val = fields.get(name)
+        if val:
+            return val
+    return None
 
-def parse_feed(xml_text: str) -> List[Dict]:
+def _build_record(fields: Dict[str, str], desc_tags: Tuple[str, ...]) -> Optional[Dict]:
+    title = normalize_ws(fields.get("title") or "")
+    # RSS: <link>http...</link>；Atom: <link href="http..." rel="alternate"/>
+    link = (fields.get("link") or "").strip() or fields.get("link_href") or ""
+    if not link:
+        return None
+    # NIH feed 的链接基本都是绝对地址，只有以 / 开头时才补全
+    if link[0] == "/":
+        link = ("https:" + link) if link[1:2] == "/" else (BASE + link)
+    date_str, date_iso = _parse_pub_date(_first(fields, ("pubDate", "updated", "published")))
+    summary = strip_html(_first(fields, desc_tags) or "")
+    return {
+        "title": title,
+        "date_str": date_str,
+        "date_iso": date_iso,
+        "summary": summary or None,
+        "url": link,
+        "page_index": -1
+    }
+
+def parse_feed(xml_data: bytes | str) -> List[Dict]:
     """
-    解析 RSS/Atom，返回标准化记录：
+    单次流式遍历解析 RSS/Atom，返回标准化记录：
       {title, date_str, date_iso, summary, url, page_index(-1)}
+    item/entry 内的子元素在各自 end 事件里按本地名收集，item/entry 结束时产出一条记录；
+    RSS 与 Atom 走同一条路径，不区分先后。
     """
+    if isinstance(xml_data, str):
+        xml_data = xml_data.encode("utf-8")
+
+    items: List[Dict] = []
+    seen_local: Set[str] = set()  # 去重（同一 feed 里的偶发重复，保留首条）
+    fields: Optional[Dict[str, str]] = None
+
     try:
-        root = ET.fromstring(xml_text)
+        for event, elem in ET.iterparse(io.BytesIO(xml_data), events=("start", "end"), **ITERPARSE_KW):
+            name = _localname(elem.tag)
+            if event == "start":
+                if name in ITEM_TAGS:
+                    fields = {}
+                continue
+
+            if fields is None:
+                continue
+            if name in FIELD_TAGS:
+                text = elem.text
+                if text and text.strip():
+                    fields.setdefault(name, text)
+                elif name == "link":
+                    href = elem.attrib.get("href")
+                    # 若有 rel="alternate" 优先
+                    if href and elem.attrib.get("rel", "") in ("alternate", ""):
+                        fields.setdefault("link_href", href)
+            elif name in ITEM_TAGS:
+                rec = _build_record(fields, DESC_TAGS[name])
+                if rec and rec["url"] not in seen_local:
+                    seen_local.add(rec["url"])
+                    items.append(rec)
+                fields = None
+                elem.clear()
     except ET.ParseError:
         return []
 
-    items: List[Dict] = []
-
-    # RSS: channel/item
-    channel = root.find("channel") or root.find(".//channel")
-    if channel is not None:
-        for it in channel.findall("item"):
-            title = normalize_ws(_find_text_any(it, ["title"]) or "")
-            link = _find_link(it) or ""
-            link = urljoin(BASE, link) if link and link.startswith("/") else link
-            date_str, date_iso = _find_pub_date(it)
-            desc = _find_text_any(it, ["description", "content", "summary"]) or ""
-            summary = strip_html(desc)
-
-            if link:
-                items.append({
-                    "title": title,
-                    "date_str": date_str,
-                    "date_iso": date_iso,
-                    "summary": summary or None,
-                    "url": link,
-                    "page_index": -1
-                })
-
-        # 已找到 RSS 项，直接返回
-        if items:
-            # 去重（同一 feed 里的偶发重复）
-            uniq: Dict[str, Dict] = {}
-            for rec in items:
-                if rec["url"] not in uniq:
-                    uniq[rec["url"]] = rec
-            return list(uniq.values())
-
-    # Atom: feed/entry
-    for it in root.findall(".//{*}entry"):
-        title = normalize_ws(_find_text_any(it, ["title"]) or "")
-        link = _find_link(it) or ""
-        link = urljoin(BASE, link) if link and link.startswith("/") else link
-        date_str, date_iso = _find_pub_date(it)
-        # Atom 的摘要可能在 <summary> 或 <content>
-        desc = _find_text_any(it, ["summary", "content"]) or ""
-        summary = strip_html(desc)
-
-        if link:
-            items.append({
-                "title": title,
-                "date_str": date_str,
-                "date_iso": date_iso,
-                "summary": summary or None,
-                "url": link,
-                "page_index": -1
-            })
-
-    # 去重
-    uniq: Dict[str, Dict] = {}
-    for rec in items:
-        if rec["url"] not in uniq:
-            uniq[rec["url"]] = rec
-    return list(uniq.values())
+    return items
 
 # =============== 主流程（持续或单次） ===============
 def run_once() -> int:
     """抓取一次 feed，追加写入新纪录；返回新增数。"""
-    xml_text = http_get_with_retries(FEED_URL)
-    if not xml_text:
+    xml_data, content_type = http_get_with_retries(FEED_URL)
+    if not xml_data:
         print(f"[{ts()}] WARN 无法获取 feed。")
         return 0
+    if not looks_like_feed(xml_data, content_type):
+        print(f"[{ts()}] WARN 返回内容不是 XML（content-type={content_type or '-'}），跳过解析。")
+        return 0
 
-    records = parse_feed(xml_text)
+    records = parse_feed(xml_data)
     print(f"[{ts()}] 解析到 {len(records)} 条。")
 
     os.makedirs(os.path.dirname(os.path.abspath(OUTPUT_PATH)) or ".", exist_ok=True)
-    seen = load_seen_urls(OUTPUT_PATH)
-    new_count = 0
-
-    for rec in records:
-        if rec["url"] in seen:
-            continue
-        if not DRY_RUN:
-            write_ndjson(OUTPUT_PATH, rec)
-        seen.add(rec["url"])
-        new_count += 1
+    new_records = filter_new_records(OUTPUT_PATH, records)
+    if not DRY_RUN:
+        write_ndjson(OUTPUT_PATH, new_records)
+    new_count = len(new_records)
 
     print(f"[{ts()}] 新增 {new_count} 条 -> {OUTPUT_PATH}（DRY_RUN={DRY_RUN}）")
     return new_count
@@ -9,8 +9,37 @@ docker exec -it news_receiver /bin/bash
 """
 import json
 import os, sys
+import time
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))  # 把 /app 加进来
+from selenium.common.exceptions import WebDriverException
 from tools.chrome import create_chrome_driver, kill_chrome_processes, add_cookies
+
+MAX_ATTEMPTS = 4      # 单个 URL 最多尝试次数
+BACKOFF_BASE = 2.0    # 重试间隔 = BACKOFF_BASE ** attempt 秒
+
+def fetch_json(chrome, url):
+    """
+    用同一个 driver 访问 url 并解析 JSON，返回 (chrome, data)；多次失败后 data 为 None。
+    - 返回内容不是 JSON（403 反爬中间页）：driver 保持不动，退避后重试
+    - WebDriverException（含 TimeoutException）：driver 已不可用，才杀掉并重建
+    """
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            chrome.get(url)
+            return chrome, json.loads(chrome.page_source)
+        except json.JSONDecodeError as e:
+            print(f"返回内容不是 JSON（可能是反爬页），第 {attempt + 1} 次: {e}")
+        except WebDriverException as e:
+            print(f"浏览器异常，重建 driver，第 {attempt + 1} 次: {e}")
+            try:
+                chrome.quit()
+            except WebDriverException:
+                pass
+            kill_chrome_processes()
+            chrome = create_chrome_driver()
+        time.sleep(BACKOFF_BASE ** attempt)
+    return chrome, None
+
 # ========== 主流程 ==========
 def main():
     kill_chrome_processes()
@@ -24,10 +53,11 @@ def main():
             # url = base_url + f'"offset":{index * 20},"requestId":{index + 1},' + extra_parameters
             url = 'https://www.reuters.com/world/china/chinas-new-home-prices-fall-fastest-pace-11-months-2025-10-20/'
             print(f"访问: {url}")
-            chrome.get(url)
+            chrome, data = fetch_json(chrome, url)
             index += 1
-            print('chrome.page_source', chrome.page_source)
-            data = json.loads(chrome.page_source)
+            if data is None:
+                print(f"重试 {MAX_ATTEMPTS} 次仍失败，结束抓取")
+                break
             result = data.get('result')
             articles = result.get('articles')
             if not articles:
@@ -44,5 +74,7 @@ def main():
 
         break
 
+    chrome.quit()
+
 if __name__ == "__main__":
     main()
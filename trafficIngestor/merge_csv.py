@@ -9,6 +9,9 @@ merge_csv.py
 """
 
 import csv
+import os
+from collections import defaultdict
+from itertools import chain
 from pathlib import Path
 from typing import Set, List, Dict
 from datetime import datetime
@@ -20,41 +23,55 @@ TEMP_CSV_PATH = '/home/pcz/code/news_receiver/trafficIngestor/collected_request_
 # =================================
 
 
-def read_csv_data(csv_path: str) -> tuple[List[Dict], Set[str], List[str]]:
+def read_csv_data(csv_path: str) -> tuple[List[Dict], Set[str], List[str], Dict[str, List[Dict]]]:
     """
     读取 CSV 文件数据
 
     Returns:
-        (rows, domains_set, header)
+        (rows, domains_set, header, domain_to_rows)
     """
     csv_file = Path(csv_path)
     if not csv_file.exists():
         print(f"错误: 文件不存在: {csv_path}")
-        return [], set(), []
+        return [], set(), [], {}
 
     rows = []
     domains = set()
+    domain_to_rows = defaultdict(list)
 
     with open(csv_path, 'r', encoding='utf-8-sig', newline='') as f:
-        reader = csv.DictReader(f)
-        header = reader.fieldnames
+        # 用 csv.reader 按列下标取值，省掉 DictReader 每行构造的中间 dict
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return rows, domains, header, {}
+
+        def col(name: str) -> int:
+            return header.index(name) if name in header else -1
+
+        id_idx = col('id')
+        url_idx = col('url')
+        # 处理可能的拼写错误: domin vs domain
+        dom_idx = col('domain') if 'domain' in header else col('domin')
+        if dom_idx < 0:
+            return rows, domains, header, {}
 
         for row in reader:
-            # 处理可能的拼写错误: domin vs domain
-            domain = row.get('domain') or row.get('domin', '')
-            domain = domain.strip()
+            n = len(row)
+            domain = row[dom_idx].strip() if dom_idx < n else ''
 
             if domain:
                 domains.add(domain)
                 # 标准化 row，确保使用 'domain' 作为键
                 normalized_row = {
-                    'id': row.get('id', '').strip(),
-                    'url': row.get('url', '').strip(),
+                    'id': row[id_idx].strip() if 0 <= id_idx < n else '',
+                    'url': row[url_idx].strip() if 0 <= url_idx < n else '',
                     'domain': domain
                 }
                 rows.append(normalized_row)
+                domain_to_rows[domain].append(normalized_row)
 
-    return rows, domains, header
+    return rows, domains, header, dict(domain_to_rows)
 
 
 def merge_csv_files(all_path: str, temp_path: str, new_path: str = None, backup: bool = True) -> Dict:
@@ -84,14 +101,14 @@ def merge_csv_files(all_path: str, temp_path: str, new_path: str = None, backup:
     }
 
     # 读取主文件
-    all_rows, all_domains, all_header = read_csv_data(all_path)
+    all_rows, all_domains, all_header, _ = read_csv_data(all_path)
     result["all_original_rows"] = len(all_rows)
     result["all_original_domains"] = len(all_domains)
 
     print(f"主文件 (all): {len(all_rows)} 行, {len(all_domains)} 个 domain")
 
     # 读取临时文件
-    temp_rows, temp_domains, temp_header = read_csv_data(temp_path)
+    temp_rows, temp_domains, temp_header, temp_index = read_csv_data(temp_path)
     result["temp_rows"] = len(temp_rows)
     result["temp_domains"] = len(temp_domains)
 
@@ -116,8 +133,8 @@ def merge_csv_files(all_path: str, temp_path: str, new_path: str = None, backup:
     for domain in sorted(new_domains):
         print(f"  + {domain}")
 
-    # 过滤出新 domain 对应的行
-    new_rows = [row for row in temp_rows if row['domain'] in new_domains]
+    # 按 domain 索引取出新 domain 对应的行，不再扫描全部 temp 行
+    new_rows = list(chain.from_iterable(temp_index[d] for d in temp_index if d in new_domains))
     result["added_rows"] = len(new_rows)
 
     print(f"\n将添加 {len(new_rows)} 行数据")
@@ -128,17 +145,32 @@ def merge_csv_files(all_path: str, temp_path: str, new_path: str = None, backup:
         shutil.copy2(all_path, backup_path)
         print(f"\n已备份原文件: {backup_path}")
 
-    # 合并数据
-    merged_rows = all_rows + new_rows
-    result["final_rows"] = len(merged_rows)
+    result["final_rows"] = len(all_rows) + len(new_rows)
     result["final_domains"] = len(all_domains | new_domains)
 
     # 写入合并后的数据
     header = ['id', 'url', 'domain']
-    with open(all_path, 'w', encoding='utf-8-sig', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=header)
-        writer.writeheader()
-        writer.writerows(merged_rows)
+    if all_header == header:
+        # 表头已是标准格式：按字节复制原文件再只追加新行，不重新解析/改写已有数据
+        tmp_path = all_path + '.tmp'
+        shutil.copy2(all_path, tmp_path)
+        needs_newline = False
+        if os.path.getsize(tmp_path) > 0:
+            with open(tmp_path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+        with open(tmp_path, 'a', encoding='utf-8-sig', newline='') as f:
+            if needs_newline:
+                f.write('\r\n')
+            writer = csv.DictWriter(f, fieldnames=header)
+            writer.writerows(new_rows)
+        os.replace(tmp_path, all_path)
+    else:
+        # 文件不存在或表头不标准（如 domin），整体改写为标准表头
+        with open(all_path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=header)
+            writer.writeheader()
+            writer.writerows(chain(all_rows, new_rows))
 
     # 将新增的 domain 数据写入单独的 CSV 文件
     if new_path is None:
@@ -190,8 +222,8 @@ def main():
         print("[DRY RUN 模式 - 不会实际修改文件]\n")
 
         # 只读取并显示统计信息
-        all_rows, all_domains, _ = read_csv_data(args.all)
-        temp_rows, temp_domains, _ = read_csv_data(args.temp)
+        all_rows, all_domains, _, _ = read_csv_data(args.all)
+        temp_rows, temp_domains, _, temp_index = read_csv_data(args.temp)
 
         new_domains = temp_domains - all_domains
         skipped_domains = temp_domains & all_domains
@@ -202,8 +234,8 @@ def main():
         print(f"跳过 domain: {len(skipped_domains)} 个")
 
         if new_domains:
-            new_rows = [row for row in temp_rows if row['domain'] in new_domains]
-            print(f"\n将添加以下 domain ({len(new_rows)} 行数据):")
+            new_row_count = sum(len(temp_index[d]) for d in new_domains)
+            print(f"\n将添加以下 domain ({new_row_count} 行数据):")
             for domain in sorted(new_domains):
                 print(f"  + {domain}")
 
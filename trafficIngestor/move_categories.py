@@ -9,6 +9,7 @@
 
 import os
 import shutil
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # 源目录
@@ -22,30 +23,71 @@ SINGLE_DST = "/netdisk/dataset/ablation_study/more/single"
 # 保留的类别数量
 TOP_N = 100
 
+# 并发统计目录大小的线程数（机械盘建议调到 4，SSD/网络存储 16~32）
+SIZE_WORKERS = 16
 
-def get_dir_size(path: Path) -> int:
+# 并发移动类别的线程数
+MOVE_WORKERS = 8
+
+
+def get_dir_size(path: str) -> int:
     """计算目录总大小（字节）"""
+    # 用 scandir 手动栈遍历：类型取自 DirEntry 的 d_type，不为每个条目构造 Path；
+    # 每个文件只有一次 lstat（DirEntry.stat 结果会缓存），符号链接不跟随
     total = 0
-    try:
-        for entry in path.rglob('*'):
-            if entry.is_file():
-                total += entry.stat().st_size
-    except (PermissionError, OSError) as e:
-        print(f"警告: 无法访问 {path}: {e}")
+    stack = [path]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        try:
+                            total += entry.stat(follow_symlinks=False).st_size
+                        except FileNotFoundError:
+                            # 遍历期间被删掉的文件跳过即可，不放弃整个目录
+                            continue
+        except OSError as e:
+            print(f"警告: 无法访问 {current}: {e}")
     return total
 
 
-def get_pcap_size(category_path: Path) -> int:
-    """获取类别下 pcap 文件夹的大小"""
-    pcap_path = category_path / "pcap"
-    if pcap_path.exists() and pcap_path.is_dir():
+def get_pcap_size(category: os.DirEntry) -> int:
+    """获取类别下 pcap 文件夹的大小（直接用 scandir 给出的 DirEntry 和 str 路径，不构造 Path）"""
+    pcap_path = os.path.join(category.path, "pcap")
+    if os.path.isdir(pcap_path):
         return get_dir_size(pcap_path)
     return 0
 
 
+def move_dir(src: str, dst: str) -> bool:
+    """
+    移动目录：同一文件系统上直接 os.rename（单次元数据操作），
+    跨文件系统或目标已存在等情况回退到 shutil.move。源不存在返回 False。
+    """
+    try:
+        os.rename(src, dst)
+    except FileNotFoundError:
+        if not os.path.exists(src):
+            return False
+        shutil.move(src, dst)
+    except OSError:
+        shutil.move(src, dst)
+    return True
+
+
+def move_category(cat_name: str) -> None:
+    """把一个类别的 batch 目录和对应的 single 目录（如果存在）移到 more 下"""
+    if move_dir(os.path.join(BATCH_SRC, cat_name), os.path.join(BATCH_DST, cat_name)):
+        print(f"移动 batch: {cat_name}")
+    if move_dir(os.path.join(SINGLE_SRC, cat_name), os.path.join(SINGLE_DST, cat_name)):
+        print(f"移动 single: {cat_name}")
+
+
 def main():
     batch_path = Path(BATCH_SRC)
-    single_path = Path(SINGLE_SRC)
 
     # 检查源目录是否存在
     if not batch_path.exists():
@@ -57,17 +99,19 @@ def main():
     os.makedirs(SINGLE_DST, exist_ok=True)
 
     # 获取所有类别
-    categories = [d for d in batch_path.iterdir() if d.is_dir()]
+    with os.scandir(BATCH_SRC) as it:
+        categories = [e for e in it if e.is_dir()]
     print(f"找到 {len(categories)} 个类别")
 
     # 计算每个类别的 pcap 大小
     print("正在计算各类别 pcap 文件夹大小...")
+    # 目录遍历是 I/O 密集型，用线程池重叠各类别的 syscall 等待
     category_sizes = []
-    for i, cat in enumerate(categories):
-        size = get_pcap_size(cat)
-        category_sizes.append((cat.name, size))
-        if (i + 1) % 100 == 0:
-            print(f"已处理 {i + 1}/{len(categories)} 个类别")
+    with ThreadPoolExecutor(max_workers=SIZE_WORKERS) as pool:
+        for i, (cat, size) in enumerate(zip(categories, pool.map(get_pcap_size, categories))):
+            category_sizes.append((cat.name, size))
+            if (i + 1) % 100 == 0:
+                print(f"已处理 {i + 1}/{len(categories)} 个类别")
 
     # 按大小降序排序
     category_sizes.sort(key=lambda x: x[1], reverse=True)
@@ -95,28 +139,13 @@ def main():
         print("操作已取消")
         return
 
-    # 移动类别
+    # 移动类别（并发执行，重叠各次 rename/拷贝的 syscall 等待）
     moved_count = 0
-    for cat_name in categories_to_move:
-        # 移动 batch 目录
-        batch_src_cat = batch_path / cat_name
-        batch_dst_cat = Path(BATCH_DST) / cat_name
-
-        if batch_src_cat.exists():
-            print(f"移动 batch: {cat_name}")
-            shutil.move(str(batch_src_cat), str(batch_dst_cat))
-
-        # 移动 single 目录（如果存在）
-        single_src_cat = single_path / cat_name
-        single_dst_cat = Path(SINGLE_DST) / cat_name
-
-        if single_src_cat.exists():
-            print(f"移动 single: {cat_name}")
-            shutil.move(str(single_src_cat), str(single_dst_cat))
-
-        moved_count += 1
-        if moved_count % 100 == 0:
-            print(f"已移动 {moved_count}/{len(categories_to_move)} 个类别")
+    with ThreadPoolExecutor(max_workers=MOVE_WORKERS) as pool:
+        for _ in pool.map(move_category, categories_to_move):
+            moved_count += 1
+            if moved_count % 100 == 0:
+                print(f"已移动 {moved_count}/{len(categories_to_move)} 个类别")
 
     print(f"\n完成! 共移动 {moved_count} 个类别")
     print(f"保留在原位置的类别: {len(top_categories)}")
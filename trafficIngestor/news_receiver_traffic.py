@@ -7,6 +7,7 @@ run_news_receiver_pool.py
 - 每行转 JSON：{"row_id": id, "url": url, "domain": domain}
 - 使用容器池 news_receiver0..78 并发执行：
     docker exec <name> python -u /app/action.py '<JSON>'
+  （每个容器只起一次常驻的 action_server.py，任务经 stdin/stdout 逐行下发）
 - 创建容器时：--init 防僵尸进程，并挂载 HOST_CODE_PATH:/app
 - 每个容器启动后执行一次：关闭包合并（tso/gso/gro off）
 
@@ -17,23 +18,32 @@ run_news_receiver_pool.py
 """
 
 from __future__ import annotations
+import atexit
 import csv
+import errno
 import os
 import sys
 import time
 import json
 import signal
 import queue
+import select
 import subprocess
 import configparser
 from pathlib import Path
-from typing import Optional, List, Dict, Tuple
+from typing import Iterator, Optional, List, Dict, Tuple
 from concurrent.futures import ThreadPoolExecutor
 import shutil
 import threading
 from sqlalchemy import create_engine, text
 from tqdm import tqdm
 
+try:  # 有 docker SDK 时复用到 dockerd 的长连接，避免每个任务 fork 一次 docker CLI
+    import docker
+    from requests.exceptions import ReadTimeout as DockerReadTimeout
+except ImportError:
+    docker = None
+
 
 def get_real_username() -> str:
     """获取真实用户名，即使在 sudo 下也能获取原始用户"""
@@ -55,9 +65,12 @@ DOCKER_EXEC_TIMEOUT = 6000        # 单次 docker exec 超时
 RETRY = 5                         # 失败重试次数（不含首次）
 NO_TASK_SLEEP_SECONDS = 600       # 无任务时等待 10 分钟
 # =================================
-EXEC_INTERVAL = 1.0  # 两次 docker exec 之间至少间隔多少秒，可自己调
+EXEC_INTERVAL = 1.0  # 按容器平均：每个容器两次任务下发之间的间隔秒数（<=0 关闭节流），可自己调
 DB_CONFIG_PATH = "/home/pcz/code/news_receiver/db/db_config.ini"
 BATCH_SIZE = 10000  # 每次从数据库获取的任务数量
+DB_WRITE_BATCH = 200      # 数据库写入线程每次最多合并的 UPDATE 条数
+DB_FLUSH_INTERVAL = 1.0   # 待写记录最长停留秒数
+WORKER_STACK_SIZE = 512 * 1024  # worker 线程栈大小；几乎全在等管道/子进程，默认 8MB 栈纯属浪费
 # 需要处理的表及其对应的 domain
 TABLES_CONFIG = [
     {"table": "dailymail_content", "domain": "dailymail.co.uk"},
@@ -66,10 +79,24 @@ TABLES_CONFIG = [
     # {"table": "forbeschina_content", "domain": "forbeschina.com"},
 ]
 
-_last_exec_ts = 0.0
-_last_exec_lock = threading.Lock()
+_exec_bucket: Optional[TokenBucket] = None  # 任务下发令牌桶，main 中按容器数创建
 _stats_lock = threading.Lock()
 _db_engine = None  # 全局数据库引擎
+_docker_client = None  # 全局 docker SDK 客户端（仅在安装了 docker 包时使用）
+_docker_containers: Dict[str, object] = {}
+_docker_lock = threading.Lock()
+_db_queue: "queue.Queue" = queue.Queue()  # 数据库写入队列，由 db_writer_loop 消费
+_log_q: "queue.SimpleQueue" = queue.SimpleQueue()  # 日志队列，由 _log_writer 线程统一输出
+# 每个容器一个常驻的 action_server.py 进程（docker exec -i），以及保护其管道的锁
+_action_procs: Dict[str, subprocess.Popen] = {}
+_action_locks: Dict[str, threading.Lock] = {}
+# 已建好目标子目录的域名，每个域名只 mkdir 一次
+_dirs_made: set = set()
+_dirs_lock = threading.Lock()
+DST_SUBDIRS = ("pcap", "ssl_key", "content", "html", "screenshot")
+# clear_host_code_subdirs 的暂存目录名，以及正在后台删除的暂存目录
+TRASH_DIRNAME = ".trash"
+_trash_jobs: Dict[str, threading.Thread] = {}
 
 # 全局统计变量
 _global_start_time = 0.0
@@ -105,116 +132,148 @@ def connect_db():
     if cs:
         url += f"?charset={cs}"
 
-    engine = create_engine(url, pool_pre_ping=True, future=True)
+    # 每个容器一个 worker 线程，连接池按容器数配置，避免并发更新时排队等连接
+    pool_n = END_IDX - START_IDX + 1
+    engine = create_engine(url, pool_size=pool_n, max_overflow=pool_n, pool_recycle=3600,
+                           pool_pre_ping=True, future=True)
     with engine.connect() as conn:
         conn.execute(text("SELECT 1"))
     return engine
 
+TABLE_MAP = {
+    "bbc.com": "bbc_content",
+    "nih.gov": "nih_content",
+    "forbeschina.com": "forbeschina_content",
+    "dailymail.co.uk": "dailymail_content",
+}
+
 def get_table_name(domain: str) -> str:
     """根据 domain 返回对应的表名"""
-    table_map = {
-        "bbc.com": "bbc_content",
-        "nih.gov": "nih_content",
-        "forbeschina.com": "forbeschina_content",
-        "dailymail.co.uk": "dailymail_content",
-    }
-    return table_map.get(domain, "")
-
-def fetch_jobs_from_db(engine, table: str, domain: str, limit: int = BATCH_SIZE) -> List[Dict[str, str]]:
+    return TABLE_MAP.get(domain, "")
+
+def fetch_jobs_from_db(engine, table: str, domain: str, limit: int = BATCH_SIZE,
+                       last_id: int = 0) -> Iterator[Dict[str, str]]:
     """
-    从数据库获取需要处理的任务（pcap_path 为空的记录）
+    从数据库流式获取需要处理的任务（pcap_path 为空的记录）
     :param engine: 数据库引擎
     :param table: 表名
     :param domain: 域名
     :param limit: 每次获取的数量
-    :return: 任务列表
+    :param last_id: 键集分页的高水位：只取 id > last_id 的记录，不再重扫之前批次已处理过的前缀
+    :return: 任务生成器（服务端游标，边取边产出，不在客户端缓冲整批结果）
+
+    建议索引（让过滤 + 排序走索引范围扫描）：
+        CREATE INDEX idx_pcap_path_id ON <table> (pcap_path(16), id);
     """
     sql = f"""
         SELECT id, url
         FROM {table}
         WHERE (pcap_path IS NULL OR pcap_path = '')
         AND url IS NOT NULL AND url <> ''
+        AND id > :last_id
         ORDER BY id
-        LIMIT {limit}
+        LIMIT :limit
     """
     
-    jobs: List[Dict[str, str]] = []
     try:
-        with engine.connect() as conn:
-            result = conn.execute(text(sql))
-            for row in result:
+        with engine.connect().execution_options(stream_results=True, yield_per=1000) as conn:
+            for row in conn.execute(text(sql), {"last_id": last_id, "limit": limit}):
                 row_id = str(row[0])
                 url = row[1]
                 if table == "wikicontent":
                     url = "https://zh.wikipedia.org/wiki/" + url
-                jobs.append({"row_id": row_id, "url": url, "domain": domain})
+                yield {"row_id": row_id, "url": url, "domain": domain, "table": table}
     except Exception as e:
         log(f"WARN: 从数据库获取任务失败: {e}")
-    
-    return jobs
-
-def upload_single_record_to_db(engine, domain: str, row_id: int, pcap_path: str,
-                                ssl_key_path: str, content_path: str, html_path: str) -> bool:
-    """上传单条记录到数据库"""
-    table = get_table_name(domain)
-    if not table:
-        log(f"WARN: 不支持的 domain: {domain}，跳过数据库上传")
-        return False
 
-    sql = f"""
+def _upload_sql(table: str):
+    return text(f"""
+        UPDATE {table}
+        SET classify_status=:classify_status,
+            traffic_status=:traffic_status,
+            pcap_path=:pcap_path,
+            ssl_key_path=:ssl_key_path,
+            content_path=:content_path,
+            html_path=:html_path
+        WHERE id=:id AND (pcap_path IS NULL OR pcap_path = '')
+    """.strip())
+
+def _mark_failed_sql(table: str):
+    return text(f"""
         UPDATE {table}
-        SET classify_status=%s,
-            traffic_status=%s,
-            pcap_path=%s,
-            ssl_key_path=%s,
-            content_path=%s,
-            html_path=%s,
-            traffic_feature=%s
-        WHERE id=%s AND (pcap_path IS NULL OR pcap_path = '')
-    """.strip()
-
-    data = (0, 0, pcap_path, ssl_key_path, content_path, html_path, None, row_id)
-
-    conn = engine.raw_connection()
+        SET pcap_path=:pcap_path
+        WHERE id=:id AND (pcap_path IS NULL OR pcap_path = '')
+    """.strip())
+
+# 每张表的 UPDATE 语句只构造一次，批量写入时直接复用（SQLAlchemy 编译缓存也按同一对象命中）
+# 任务字典直接带表名，TABLES_CONFIG 里的表也要覆盖到
+_DB_TABLES = set(TABLE_MAP.values()) | {c["table"] for c in TABLES_CONFIG}
+_UPLOAD_SQL = {table: _upload_sql(table) for table in _DB_TABLES}
+_MARK_FAILED_SQL = {table: _mark_failed_sql(table) for table in _DB_TABLES}
+
+def queue_db_upload(table: str, row_id: int, pcap_path: str,
+                    ssl_key_path: str, content_path: str, html_path: str) -> None:
+    """成功记录放入数据库写入队列，由 db_writer_loop 批量提交；table 取自任务字典"""
+    _db_queue.put(("ok", table, {
+        "classify_status": 0, "traffic_status": 0,
+        "pcap_path": pcap_path, "ssl_key_path": ssl_key_path,
+        "content_path": content_path, "html_path": html_path,
+        "id": row_id,
+    }))
+
+def queue_db_failed(table: str, row_id: int) -> None:
+    """失败记录放入数据库写入队列，只更新 pcap_path='error'"""
+    _db_queue.put(("fail", table, {"pcap_path": "error", "id": row_id}))
+
+def _flush_db_pending(engine, pending: List[Tuple[str, str, Dict]]) -> None:
+    """按 (类型, 表) 分组，在一个事务里对每组做一次 executemany"""
+    groups: Dict[Tuple[str, str], List[Dict]] = {}
+    for kind, table, params in pending:
+        groups.setdefault((kind, table), []).append(params)
     try:
-        with conn.cursor() as cur:
-            cur.execute(sql, data)
-            affected = cur.rowcount
-        conn.commit()
-        return affected > 0
+        with engine.begin() as conn:
+            for (kind, table), rows in groups.items():
+                sql = (_UPLOAD_SQL if kind == "ok" else _MARK_FAILED_SQL)[table]
+                affected = conn.execute(sql, rows).rowcount
+                log(f"数据库批量{'更新' if kind == 'ok' else '标记失败'} {table}: "
+                    f"{len(rows)} 条，命中 {affected} 行")
     except Exception as e:
-        log(f"WARN: 数据库更新失败 row_id={row_id}: {e}")
-        return False
-    finally:
-        conn.close()
-
-def mark_failed_record_to_db(engine, domain: str, row_id: int) -> bool:
-    """标记失败记录到数据库，只更新 pcap_path='error'"""
-    table = get_table_name(domain)
-    if not table:
-        log(f"WARN: 不支持的 domain: {domain}，跳过数据库标记")
-        return False
-
-    sql = f"""
-        UPDATE {table}
-        SET pcap_path=%s
-        WHERE id=%s AND (pcap_path IS NULL OR pcap_path = '')
-    """.strip()
+        ids = [params["id"] for _, _, params in pending]
+        log(f"WARN: 数据库批量写入失败 ({len(ids)} 条) row_ids={ids[:20]}: {e}")
 
-    data = ('error', row_id)
+def db_writer_loop(engine) -> None:
+    """
+    数据库写入线程：攒够 DB_WRITE_BATCH 条或距第一条待写超过 DB_FLUSH_INTERVAL 秒就提交一次。
+    队列里收到 threading.Event 表示"立即刷盘后通知"，收到 None 表示刷盘后退出。
+    """
+    pending: List[Tuple[str, str, Dict]] = []
+    deadline: Optional[float] = None
+    while True:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        try:
+            item = _db_queue.get(timeout=timeout)
+        except queue.Empty:
+            item = False
+        if isinstance(item, tuple):
+            pending.append(item)
+            if deadline is None:
+                deadline = time.monotonic() + DB_FLUSH_INTERVAL
+            if len(pending) < DB_WRITE_BATCH and time.monotonic() < deadline:
+                continue
+        if pending:
+            _flush_db_pending(engine, pending)
+            pending = []
+        deadline = None
+        if isinstance(item, threading.Event):
+            item.set()
+        elif item is None:
+            return
 
-    conn = engine.raw_connection()
-    try:
-        with conn.cursor() as cur:
-            cur.execute(sql, data)
-            affected = cur.rowcount
-        conn.commit()
-        return affected > 0
-    except Exception as e:
-        log(f"WARN: 数据库标记失败 row_id={row_id}: {e}")
-        return False
-    finally:
-        conn.close()
+def flush_db_writes() -> None:
+    """阻塞直到队列中已有的数据库写入全部提交"""
+    done = threading.Event()
+    _db_queue.put(done)
+    done.wait()
 
 
 def clear_host_code_subdirs(base: str | Path = HOST_CODE_PATH) -> None:
@@ -229,42 +288,206 @@ def clear_host_code_subdirs(base: str | Path = HOST_CODE_PATH) -> None:
         log(f"WARN: HOST_CODE_PATH 不存在或不是目录：{base_path}")
         return
 
-    for entry in base_path.iterdir():
+    # 子目录先 rename 进 .trash/<时间戳>（同一文件系统，O(1)），真正的删除交给后台线程，
+    # 主循环不必等几万次 unlink 完成就能开始下一批
+    trash = base_path / TRASH_DIRNAME
+    staging = trash / str(time.time_ns())
+    # os.scandir 的 is_dir 直接用 getdents 返回的类型，不再逐项 stat；先收集再改名，不边遍历边改目录
+    with os.scandir(base_path) as it:
         # 只处理子目录，不处理文件
-        if entry.is_dir():
+        subdirs = [e for e in it if e.is_dir(follow_symlinks=False) and e.name != TRASH_DIRNAME]
+    for entry in subdirs:
+        try:
+            staging.mkdir(parents=True, exist_ok=True)
+            os.rename(entry.path, staging / entry.name)
+            log(f"删除子目录: {entry.path}")
+        except OSError:
             try:
-                shutil.rmtree(entry)
-                log(f"删除子目录: {entry}")
+                shutil.rmtree(entry.path)
+                log(f"删除子目录: {entry.path}")
             except Exception as e:
-                log(f"WARN: 删除子目录失败: {entry} -> {e}")
+                log(f"WARN: 删除子目录失败: {entry.path} -> {e}")
 
-def _wait_before_exec():
-    """
-    全局节流：保证所有线程之间，每次 docker exec 至少间隔 EXEC_INTERVAL 秒。
-    """
-    global _last_exec_ts
+    # 顺带接手上次运行没删完的暂存目录（后台线程是 daemon，进程退出时可能未完成）
+    if trash.is_dir():
+        for old in trash.iterdir():
+            _purge_in_background(old)
+
+def _purge_in_background(path: Path) -> None:
+    key = str(path)
+    t = _trash_jobs.get(key)
+    if t is not None and t.is_alive():
+        return
+
+    def purge():
+        run(["rm", "-rf", key])
+        _trash_jobs.pop(key, None)
+
+    t = threading.Thread(target=purge, name=f"purge-{path.name}", daemon=True)
+    _trash_jobs[key] = t
+    t.start()
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """阻塞直到拿到一个令牌；保证所有线程合计不超过 rate 次/秒，允许 capacity 次突发。"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def _log_writer() -> None:
+    """唯一的日志输出线程：一次取空队列再整体写出，worker 调 log() 只需入队。"""
     while True:
-        with _last_exec_lock:
-            now = time.monotonic()
-            delta = _last_exec_ts + EXEC_INTERVAL - now
-            if delta <= 0:
-                # 轮到我执行了，记录时间点后返回
-                _last_exec_ts = now
-                return
-        # 还没轮到我，先睡一会儿再抢
-        if delta > 0:
-            time.sleep(min(delta, 0.5))
+        item = _log_q.get()
+        lines, events = [], []
+        while True:
+            if isinstance(item, threading.Event):
+                events.append(item)
+            else:
+                lines.append(item)
+            try:
+                item = _log_q.get_nowait()
+            except queue.Empty:
+                break
+        if lines:
+            if _pbar is not None:
+                for msg in lines:
+                    tqdm.write(msg)
+            else:
+                sys.stdout.write("\n".join(lines) + "\n")
+                sys.stdout.flush()
+        for ev in events:
+            ev.set()
+
+def flush_logs(timeout: float = 5.0) -> None:
+    """等日志线程把已入队的日志全部写出（进程退出前由 atexit 调用）"""
+    ev = threading.Event()
+    _log_q.put(ev)
+    ev.wait(timeout)
+
+_ts_cache: Tuple[int, str] = (0, "")
+
+def _now_ts() -> str:
+    """当前秒的格式化时间，同一秒内复用；整体替换元组，并发读也不会拿到半更新的值"""
+    global _ts_cache
+    t = int(time.time())
+    cached_t, cached_s = _ts_cache
+    if t != cached_t:
+        cached_s = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(t))
+        _ts_cache = (t, cached_s)
+    return cached_s
+
 def log(*a):
-    ts = time.strftime("%Y-%m-%d %H:%M:%S")
-    msg = f"[{ts}] " + " ".join(str(x) for x in a)
-    if _pbar is not None:
-        tqdm.write(msg)
-    else:
-        print(msg, flush=True)
+    _log_q.put(f"[{_now_ts()}] " + " ".join(str(x) for x in a))
+
+threading.Thread(target=_log_writer, name="log-writer", daemon=True).start()
+atexit.register(flush_logs)
 
 def run(cmd: List[str], timeout: Optional[int] = None) -> subprocess.CompletedProcess:
     return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
 
+def _get_container(name: str):
+    """按容器名取 docker SDK 的 Container 对象，首次用到时创建客户端并缓存。"""
+    global _docker_client
+    c = _docker_containers.get(name)
+    if c is None:
+        with _docker_lock:
+            if _docker_client is None:
+                _docker_client = docker.from_env(timeout=DOCKER_EXEC_TIMEOUT,
+                                                 max_pool_size=END_IDX - START_IDX + 1)
+            c = _docker_containers[name] = _docker_client.containers.get(name)
+    return c
+
+def docker_exec(container: str, argv: List[str], timeout: Optional[int] = None) -> subprocess.CompletedProcess:
+    """
+    在容器内执行命令。装了 docker SDK 就走 exec_run，否则回退到 docker exec 子进程；
+    返回值统一为 CompletedProcess，超时统一抛 subprocess.TimeoutExpired。
+    """
+    if docker is None:
+        return run(["docker", "exec", container, *argv], timeout=timeout)
+    try:
+        res = _get_container(container).exec_run(argv, demux=True)
+    except DockerReadTimeout:
+        raise subprocess.TimeoutExpired(argv, timeout or DOCKER_EXEC_TIMEOUT)
+    out, err = res.output if res.output else (None, None)
+    return subprocess.CompletedProcess(
+        argv, res.exit_code,
+        stdout=(out or b"").decode("utf-8", "replace"),
+        stderr=(err or b"").decode("utf-8", "replace"),
+    )
+
+def _action_server(container: str) -> subprocess.Popen:
+    """取容器对应的常驻 action_server 进程；首次使用或进程已退出时重新拉起。"""
+    proc = _action_procs.get(container)
+    if proc is None or proc.poll() is not None:
+        proc = subprocess.Popen(
+            ["docker", "exec", "-i", container,
+             "python", "-u", f"{CONTAINER_CODE_PATH}/action_server.py"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding="utf-8", bufsize=1,
+        )
+        _action_procs[container] = proc
+    return proc
+
+def _stop_action_server(container: str) -> None:
+    proc = _action_procs.pop(container, None)
+    if proc is not None and proc.poll() is None:
+        proc.kill()
+        proc.wait()
+
+def stop_action_servers() -> None:
+    """关闭所有常驻 action_server：关 stdin 让其读到 EOF 正常退出。"""
+    for container, proc in list(_action_procs.items()):
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=10)
+        except Exception:
+            _stop_action_server(container)
+    _action_procs.clear()
+
+def run_action(container: str, payload: str,
+               timeout: Optional[int] = None) -> Tuple[bool, str, Optional[Dict]]:
+    """
+    把一条任务发给容器的常驻 action_server，等待其一行应答。
+    返回 (ok, err, result)，result 为 action.start_task 的结果（失败时为 None）。
+    超时则杀掉该进程（下次自动重启）并抛 subprocess.TimeoutExpired。
+    """
+    lock = _action_locks.setdefault(container, threading.Lock())
+    with lock:
+        proc = _action_server(container)
+        try:
+            proc.stdin.write(payload + "\n")
+            proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            _stop_action_server(container)
+            return False, f"action_server 写入失败: {e}", None
+        ready, _, _ = select.select([proc.stdout], [], [], timeout)
+        if not ready:
+            _stop_action_server(container)
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+        line = proc.stdout.readline()
+    if not line:
+        _stop_action_server(container)
+        return False, "action_server 已退出", None
+    try:
+        reply = json.loads(line)
+    except json.JSONDecodeError:
+        return False, f"action_server 应答无法解析: {line.strip()[:200]}", None
+    return bool(reply.get("ok")), reply.get("error", ""), reply.get("result")
+
 def ensure_docker_available():
     try:
         run(["docker", "version"]).check_returncode()
@@ -283,6 +506,23 @@ def container_running(name: str) -> bool:
     cp = run(["docker", "inspect", "-f", "{{.State.Running}}", name])
     return (cp.returncode == 0) and (cp.stdout.strip().lower() == "true")
 
+def snapshot_containers(prefix: str) -> Optional[Dict[str, str]]:
+    """
+    一次 docker ps 拿到所有同前缀容器的 {name: state}（running/exited/created…）。
+    失败返回 None，调用方回退到逐个 docker inspect。
+    """
+    cp = run(["docker", "ps", "-a", "--no-trunc",
+              "--format", "{{.Names}}\t{{.State}}", "--filter", f"name=^{prefix}"])
+    if cp.returncode != 0:
+        log(f"WARN: docker ps 失败，回退逐个 inspect：{cp.stderr.strip()}")
+        return None
+    snap: Dict[str, str] = {}
+    for line in cp.stdout.splitlines():
+        name, _, state = line.partition("\t")
+        if name:
+            snap[name] = state.strip().lower()
+    return snap
+
 def create_container(name: str, host_code_path: str, image: str):
     uid, gid = str(os.getuid()), str(os.getgid())
     cmd = [
@@ -332,7 +572,7 @@ def disable_offload_once(name: str):
         fi
         exit $rc
     '''
-    cp = run(["docker", "exec", name, "sh", "-lc", shell])
+    cp = docker_exec(name, ["sh", "-lc", shell])
     if cp.returncode == 0:
         log(f"{name}: offload disabled (TSO/GSO/GRO off)")
     else:
@@ -361,38 +601,87 @@ def build_container_names(prefix: str, start_idx: int, end_idx: int) -> List[str
 
 
 def chown_recursive(path: str, uid: int = 1002, gid: int = 1002) -> None:
-    """把 path（文件或目录）及其子项（若为目录）设为 uid:gid。尽量不抛异常。"""
-    import os
+    """
+    把 path（文件或目录）及其子项（若为目录）设为 uid:gid。尽量不抛异常。
+    目录用 os.fwalk 遍历，子项按 dir_fd 相对名 chown，省掉每次从根解析整条路径。
+    """
     try:
         os.chown(path, uid, gid, follow_symlinks=False)
     except Exception:
         pass
     if os.path.isdir(path):
-        for root, dirs, files in os.walk(path, followlinks=False):
-            for name in dirs:
-                p = os.path.join(root, name)
-                try: os.chown(p, uid, gid, follow_symlinks=False)
+        for _, dirs, files, dfd in os.fwalk(path, follow_symlinks=False):
+            for name in dirs + files:
+                try: os.chown(name, uid, gid, dir_fd=dfd, follow_symlinks=False)
                 except Exception: pass
-            for name in files:
-                p = os.path.join(root, name)
-                try: os.chown(p, uid, gid, follow_symlinks=False)
+
+def _host_path(path: str) -> str:
+    """容器内 /app/... 路径映射为宿主机 HOST_CODE_PATH/...（只换开头的前缀）"""
+    if path.startswith(CONTAINER_CODE_PATH + "/"):
+        return HOST_CODE_PATH + path[len(CONTAINER_CODE_PATH):]
+    return path
+
+def ensure_dst_dirs(domain: str) -> str:
+    """首次见到该域名时创建 DASE_DST/<domain>/ 下的各子目录，之后直接返回目录路径。"""
+    dst = os.path.join(DASE_DST, domain)
+    if domain in _dirs_made:
+        return dst
+    with _dirs_lock:
+        if domain not in _dirs_made:
+            for sub in DST_SUBDIRS:
+                Path(dst, sub).mkdir(parents=True, exist_ok=True)
+            _dirs_made.add(domain)
+    return dst
+
+def move_and_chown(src: str, dst_dir: str, uid: int = 1002, gid: int = 1002) -> str:
+    """
+    把 src 移到 dst_dir 下并设为 uid:gid，返回新路径。
+    同一文件系统直接 os.rename（一次元数据操作）后 chown；
+    跨文件系统（EXDEV）时回退到 shutil.move，并在拷贝每个文件时顺手 chown，不再二次遍历。
+    """
+    dst = os.path.join(dst_dir, os.path.basename(src))
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+
+        def copy_and_chown(s: str, d: str) -> str:
+            d = shutil.copy2(s, d)
+            try:
+                os.chown(d, uid, gid, follow_symlinks=False)
+            except Exception:
+                pass
+            return d
+
+        dst = shutil.move(src, dst_dir, copy_function=copy_and_chown)
+        if os.path.isdir(dst):
+            # copytree 新建的目录本身还需要设属主
+            for root, _, _ in os.walk(dst):
+                try: os.chown(root, uid, gid, follow_symlinks=False)
                 except Exception: pass
+        return dst
+    if os.path.isdir(dst):
+        chown_recursive(dst, uid, gid)
+    else:
+        try:
+            os.chown(dst, uid, gid, follow_symlinks=False)
+        except Exception:
+            pass
+    return dst
 
 def exec_once(task: Dict[str, str]) -> Tuple[bool, str]:
-    _wait_before_exec()
     payload = json.dumps(task, ensure_ascii=False)
     container = task["container"]
-    cmd = [
-        "docker", "exec", container,
-        "python", "-u", f"{CONTAINER_CODE_PATH}/action.py",
-        payload
-    ]
-    log("执行命令", cmd)
-    cp = run(cmd, timeout=DOCKER_EXEC_TIMEOUT)
-    if cp.returncode == 0:
+    log("下发任务", container, payload)
+    if _exec_bucket is not None:
+        _exec_bucket.acquire()  # 令牌只管真正的下发，序列化和日志不占节流时间
+    ok, err, result = run_action(container, payload, timeout=DOCKER_EXEC_TIMEOUT)
+    if ok:
         try:
-            with open(HOST_CODE_PATH + f"/meta/{container}_last.json", "r", encoding="utf-8") as f:
-                result = json.load(f)
+            if not isinstance(result, dict):
+                # 不读 meta 文件兜底：那可能是更早任务留下的旧结果
+                return False, "action_server reply missing result"
             log('result', result)
             pcap_path = result.get("pcap_path")
             ssl_key_file_path = result.get("ssl_key_file_path")
@@ -403,75 +692,58 @@ def exec_once(task: Dict[str, str]) -> Tuple[bool, str]:
             if not all([pcap_path, ssl_key_file_path, content_path, html_path, screenshot_path]):
                 return False, "result JSON missing required paths"
 
-            pcap_path = pcap_path.replace("/app", HOST_CODE_PATH)
-            ssl_key_file_path = ssl_key_file_path.replace("/app", HOST_CODE_PATH)
-            content_path = content_path.replace("/app", HOST_CODE_PATH)
-            html_path = html_path.replace("/app", HOST_CODE_PATH)
-            screenshot_path = screenshot_path.replace("/app", HOST_CODE_PATH)
+            pcap_path = _host_path(pcap_path)
+            ssl_key_file_path = _host_path(ssl_key_file_path)
+            content_path = _host_path(content_path)
+            html_path = _host_path(html_path)
+            screenshot_path = _host_path(screenshot_path)
             log('screenshot_path', screenshot_path)
-            dst = os.path.join(DASE_DST, task['domain'])
-            pcap_dst = os.path.join(dst, 'pcap')
-            if not os.path.exists(pcap_dst):
-                os.makedirs(pcap_dst)
-            ssl_key_dst = os.path.join(dst, 'ssl_key')
-            if not os.path.exists(ssl_key_dst):
-                os.makedirs(ssl_key_dst)
-            content_dst = os.path.join(dst, 'content')
-            if not os.path.exists(content_dst):
-                os.makedirs(content_dst)
-            html_dst = os.path.join(dst, 'html')
-            if not os.path.exists(html_dst):
-                os.makedirs(html_dst)
-            screenshot_dst = os.path.join(dst, 'screenshot')
-            if not os.path.exists(screenshot_dst):
-                os.makedirs(screenshot_dst)
-
-            new_pcap = shutil.move(pcap_path, pcap_dst)
-            chown_recursive(new_pcap, uid=1002, gid=1002)
-
-            new_ssl = shutil.move(ssl_key_file_path, ssl_key_dst)
-            chown_recursive(new_ssl, uid=1002, gid=1002)
-
-            new_content = shutil.move(content_path, content_dst)
-            chown_recursive(new_content, uid=1002, gid=1002)
-
-            new_html = shutil.move(html_path, html_dst)
-            chown_recursive(new_html, uid=1002, gid=1002)
-
-            new_screenshot = shutil.move(screenshot_path, screenshot_dst)
-            chown_recursive(new_screenshot, uid=1002, gid=1002)
-
-            # 上传到数据库
+            dst = ensure_dst_dirs(task['domain'])
+            # 目标保持 <domain>/{pcap,ssl_key,...}/ 分类型布局：check_pcap_dataset、move_categories
+            # 和库里的路径都依赖它。五个源文件在同一文件系统，每个只是一次 rename，
+            # 改成"整目录 rename + 硬链接回填"反而更多系统调用
+            moves = (
+                (pcap_path, 'pcap'),
+                (ssl_key_file_path, 'ssl_key'),
+                (content_path, 'content'),
+                (html_path, 'html'),
+                (screenshot_path, 'screenshot'),
+            )
+            new_paths = []
+            for src, sub in moves:
+                new_paths.append(move_and_chown(src, os.path.join(dst, sub), uid=1002, gid=1002))
+            new_pcap, new_ssl, new_content, new_html, new_screenshot = new_paths
+
+            # 上传到数据库（入队，由写入线程批量提交）
             try:
                 row_id_int = int(task.get("row_id", "0"))
-                domain = task.get("domain", "")
-                if _db_engine and domain:
-                    db_ok = upload_single_record_to_db(
-                        _db_engine, domain, row_id_int,
-                        new_pcap, new_ssl, new_content, new_html
-                    )
-                    if db_ok:
-                        log(f"数据库更新成功 row_id={row_id_int}")
-                    else:
-                        log(f"数据库更新失败或无匹配行 row_id={row_id_int}")
+                table = task.get("table", "")
+                if _db_engine and table:
+                    queue_db_upload(table, row_id_int,
+                                    new_pcap, new_ssl, new_content, new_html)
             except Exception as e:
                 log(f"WARN: 数据库操作异常 row_id={task.get('row_id','')}: {e}")
 
             return True, ""
-        except (json.JSONDecodeError, FileNotFoundError, OSError) as e:
+        except (FileNotFoundError, OSError) as e:
             return False, f"post-processing error: {e}"
-    return False, (cp.stderr.strip() or cp.stdout.strip())
+    return False, err
 
 
-def worker_loop(container: str, q: "queue.Queue[Dict[str, str]]", stats: dict, retry: int):
+def worker_loop(container: str, q: "queue.SimpleQueue[Optional[Dict[str, str]]]",
+                errors: List[Tuple[Dict[str, str], str]], retry: int) -> Tuple[int, int]:
     """
     带重试的 worker：每个任务最多尝试 retry+1 次（首次 + retry 次重试）
+    任务边从数据库取边入队，worker 阻塞等待，收到 None 哨兵才退出。
+    成功/失败数在线程内本地累计，退出时返回 (ok, fail)，由主线程汇总；
+    失败样例直接 append 到共享列表（单次 append 在 CPython 下是原子的）。
     """
+    ok_count = 0
+    fail_count = 0
     while True:
-        try:
-            task = q.get_nowait()
-        except queue.Empty:
-            return
+        task = q.get()
+        if task is None:
+            return ok_count, fail_count
         row_id = task.get("row_id", "")
         url    = task.get("url", "")
         task["container"] = container
@@ -490,8 +762,7 @@ def worker_loop(container: str, q: "queue.Queue[Dict[str, str]]", stats: dict, r
                 if ok:
                     task_elapsed = time.time() - task_start_time
                     log(f"{container} -> done  [{row_id}] {url} ({task_elapsed:.1f}s)")
-                    with _stats_lock:
-                        stats["ok"] += 1
+                    ok_count += 1
                     _update_progress(ok=True, task_elapsed=task_elapsed)
                     break  # 成功，跳出重试循环
                 else:
@@ -517,23 +788,16 @@ def worker_loop(container: str, q: "queue.Queue[Dict[str, str]]", stats: dict, r
             # 失败时也写数据库，标记 pcap_path='error'
             try:
                 row_id_int = int(task.get("row_id", "0"))
-                domain = task.get("domain", "")
-                if _db_engine and domain:
-                    db_ok = mark_failed_record_to_db(_db_engine, domain, row_id_int)
-                    if db_ok:
-                        log(f"失败记录已标记到数据库 row_id={row_id_int}")
-                    else:
-                        log(f"数据库标记失败或无匹配行 row_id={row_id_int}")
+                table = task.get("table", "")
+                if _db_engine and table:
+                    queue_db_failed(table, row_id_int)
             except Exception as e:
                 log(f"WARN: 数据库标记异常 row_id={task.get('row_id','')}: {e}")
-            with _stats_lock:
-                stats["fail"] += 1
-                stats["errors"].append((task, err))
+            fail_count += 1
+            errors.append((task, err))
             task_elapsed = time.time() - task_start_time
             _update_progress(ok=False, task_elapsed=task_elapsed)
 
-        q.task_done()
-
 def _update_progress(ok: bool, task_elapsed: float = 0.0) -> None:
     """更新全局进度条"""
     global _global_ok, _global_fail, _global_task_time
@@ -573,43 +837,68 @@ def prepare_pool_once() -> List[str]:
 
     created: List[str] = []
     created_lock = threading.Lock()
+    snap = snapshot_containers(CONTAINER_PREFIX)
 
     def check_and_create(name: str) -> None:
         """检查容器是否存在，不存在则创建"""
-        exists = container_exists(name)
-        if exists is None:
+        exists = (name in snap) if snap is not None else (container_exists(name) is not None)
+        if not exists:
             create_container(name, str(host_code), DOCKER_IMAGE)
             with created_lock:
                 created.append(name)
 
-    # Pass 1：缺就建（并发执行，记录本轮新建的容器名）
-    with ThreadPoolExecutor(max_workers=min(len(names), 20)) as pool:
-        pool.map(check_and_create, names)
+    workers = min(len(names), 20)
 
-    # Pass 2：不在运行的统一 start（包含老容器；新建容器通常已在运行，冪等调用无害）
-    for n in names:
-        if not container_running(n):
-            start_container(n)
+    # Pass 1：缺就建（并发执行，记录本轮新建的容器名）
+    # 消费 map 结果：create_container 失败时的 sys.exit 才能传回主线程
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(check_and_create, names))
+
+    # Pass 2：不在运行的统一 start（包含老容器；docker run -d 新建的容器已在运行）
+    created_set = set(created)
+    to_start = [
+        n for n in names
+        if n not in created_set
+        and not ((snap.get(n) == "running") if snap is not None else container_running(n))
+    ]
+    if to_start:
+        with ThreadPoolExecutor(max_workers=min(len(to_start), workers)) as pool:
+            list(pool.map(start_container, to_start))
 
     time.sleep(5)
-    # Pass 3：所有 docker run 完成后，按顺序对“本次新建”的容器执行一次 offload 关闭
-    for n in created:
-        disable_offload_once(n)
+    # Pass 3：所有 docker run 完成后，对“本次新建”的容器并发执行一次 offload 关闭
+    if created:
+        with ThreadPoolExecutor(max_workers=min(len(created), workers)) as pool:
+            list(pool.map(disable_offload_once, created))
 
     return names
 
+def remove_pool_containers() -> None:
+    """
+    删除所有同前缀的容器：一次 docker ps 取名字，再一次 docker rm -f 全部删掉，
+    不再经 sh + xargs 管道多起几个进程。docker ps 失败时按配置的容器名删。
+    """
+    snap = snapshot_containers(CONTAINER_PREFIX)
+    names = list(snap) if snap is not None else build_container_names(CONTAINER_PREFIX, START_IDX, END_IDX)
+    if names:
+        run(["docker", "rm", "-f", *names])
+
 # ——收到中断后“立刻”退出（不等线程/子进程收尾，不跑 finally）——
 def sig(signum, _frame):
     log(f"收到中断信号({signum})，立即退出。")
     try:
+        # os._exit 不走 atexit，先等日志线程把队列（含上面这条）写出
+        flush_logs()
         sys.stdout.flush(); sys.stderr.flush()
     finally:
         os._exit(128 + signum)  # 130=SIGINT, 143=SIGTERM
 
 def main():
-    global _db_engine, _global_start_time, _global_ok, _global_fail, _global_task_time, _pbar
+    global _db_engine, _exec_bucket, _global_start_time, _global_ok, _global_fail, _global_task_time, _pbar
     signal.signal(signal.SIGINT, sig)
     signal.signal(signal.SIGTERM, sig)
+    # 之后创建的所有线程（容器 worker、DB 写入、建池）都用较小的栈
+    threading.stack_size(WORKER_STACK_SIZE)
 
     # 初始化数据库连接
     try:
@@ -619,7 +908,17 @@ def main():
         log(f"FATAL: 数据库连接失败，无法继续: {e}")
         return
 
+    # 数据库写入线程：把每个任务的 UPDATE 合并成批量提交
+    db_writer = threading.Thread(target=db_writer_loop, args=(_db_engine,),
+                                 name="db-writer", daemon=True)
+    db_writer.start()
+
     names = prepare_pool_once()
+    # 节流按容器数放大：整体上限 len(names)/EXEC_INTERVAL 次/秒，而不是全局 1 次/秒。
+    # capacity=1 不允许突发：桶一开始就满会让所有容器同时拉起 Chrome/tcpdump，启动仍需按 rate 错开
+    if EXEC_INTERVAL > 0:
+        _exec_bucket = TokenBucket(rate=len(names) / EXEC_INTERVAL, capacity=1)
+    last_ids: Dict[str, int] = {}  # 每张表本次运行已取到的最大 id（键集分页）
     total_ok = 0
     total_fail = 0
     batch_num = 0
@@ -636,39 +935,46 @@ def main():
 
     try:
         while True:
-            # 从所有表中获取任务
-            all_jobs: List[Dict[str, str]] = []
-            for table_config in TABLES_CONFIG:
-                table = table_config["table"]
-                domain = table_config["domain"]
-                jobs = fetch_jobs_from_db(_db_engine, table, domain, BATCH_SIZE)
-                if jobs:
-                    log(f"从 {table} 获取了 {len(jobs)} 条任务")
-                    all_jobs.extend(jobs)
-            
-            if not all_jobs:
+            # 先起 worker，再从所有表流式取任务直接入队：首批任务到达即开始执行
+            q: "queue.SimpleQueue[Optional[Dict[str, str]]]" = queue.SimpleQueue()
+            errors: List[Tuple[Dict[str, str], str]] = []
+            job_count = 0
+            log(f"===== 批次 {batch_num + 1}: 开始执行，并发容器={len(names)}，镜像={DOCKER_IMAGE} =====")
+            with ThreadPoolExecutor(max_workers=len(names)) as pool:
+                futures = [pool.submit(worker_loop, n, q, errors, RETRY) for n in names]
+                for table_config in TABLES_CONFIG:
+                    table = table_config["table"]
+                    domain = table_config["domain"]
+                    table_count = 0
+                    for job in fetch_jobs_from_db(_db_engine, table, domain, BATCH_SIZE,
+                                                  last_ids.get(table, 0)):
+                        q.put(job)
+                        table_count += 1
+                        last_ids[table] = int(job["row_id"])  # ORDER BY id，最后一条即最大 id
+                    if table_count:
+                        log(f"从 {table} 获取了 {table_count} 条任务")
+                    job_count += table_count
+                for _ in names:
+                    q.put(None)
+            # 退出 with 时所有 worker 已收到哨兵结束，汇总各线程的本地计数
+            stats = {"ok": 0, "fail": 0, "errors": errors}
+            for f in futures:
+                ok_n, fail_n = f.result()
+                stats["ok"] += ok_n
+                stats["fail"] += fail_n
+
+            if not job_count:
                 log("所有表都没有需要处理的任务，退出。")
                 break
-            
-            batch_num += 1
-            log(f"===== 批次 {batch_num}: 共 {len(all_jobs)} 条任务 =====")
-
-            # 调度执行
-            q: "queue.Queue[Dict[str, str]]" = queue.Queue()
-            for t in all_jobs:
-                q.put(t)
 
-            stats = {"ok": 0, "fail": 0, "errors": []}  # type: ignore[dict-item]
-            log(f"开始执行：jobs={len(all_jobs)}，并发容器={len(names)}，镜像={DOCKER_IMAGE}")
-            with ThreadPoolExecutor(max_workers=len(names)) as pool:
-                for n in names:
-                    pool.submit(worker_loop, n, q, stats, RETRY)
-                q.join()
+            batch_num += 1
+            # 下一轮按 pcap_path 为空取任务，必须先把本批次的数据库写入全部提交
+            flush_db_writes()
 
             # 汇总本批次
             total_ok += stats['ok']
             total_fail += stats['fail']
-            log(f"[批次 {batch_num} 汇总] success={stats['ok']} fail={stats['fail']} batch_total={len(all_jobs)}")
+            log(f"[批次 {batch_num} 汇总] success={stats['ok']} fail={stats['fail']} batch_total={job_count}")
             if stats["errors"]:
                 log("失败样例：")
                 for task, err in stats["errors"][:10]:
@@ -681,6 +987,9 @@ def main():
     except Exception as e:
         log(f"WARN: 执行异常：{e}")
     finally:
+        stop_action_servers()
+        _db_queue.put(None)
+        db_writer.join()
         # 关闭进度条
         if _pbar is not None:
             _pbar.close()
@@ -698,7 +1007,7 @@ def main():
 
 
 if __name__ == "__main__":
-    subprocess.run(f'docker ps -aq -f "name=^{CONTAINER_PREFIX}" | xargs -r docker rm -f', shell=True, check=False)
+    remove_pool_containers()
     clear_host_code_subdirs()
     main()
-    subprocess.run(f'docker ps -aq -f "name=^{CONTAINER_PREFIX}" | xargs -r docker rm -f', shell=True, check=False)
+    remove_pool_containers()
@@ -12,19 +12,41 @@ news_receiver_traffic_ingestor_batch.py
 
 from __future__ import annotations
 import csv
+import errno
+import itertools
 import os
+import stat
 import sys
 import time
 import json
 import signal
-import queue
+import select
 import subprocess
+from collections import defaultdict
+from operator import itemgetter
 from pathlib import Path
 from typing import Optional, List, Dict, Tuple, Any
 from concurrent.futures import ThreadPoolExecutor
 import shutil
 import threading
 
+try:  # 有 docker SDK 时复用到 dockerd 的长连接（UNIX socket 上的 HTTP），不再每次 fork docker CLI
+    import docker
+    from requests.exceptions import ReadTimeout as DockerReadTimeout
+except ImportError:
+    docker = None
+
+try:  # 批量任务的 payload 含上千个 URL，编解码优先用 orjson（非 ASCII 原样输出为 UTF-8）
+    import orjson
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+    json_loads = orjson.loads
+except ImportError:
+    def json_dumps(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+    json_loads = json.loads
+
 # ============== 配置 ==============
 CODE_BASE_PATH = '/home/pcz/code/news_receiver'
 CSV_PATH = "collected_request_urls_all.csv"
@@ -34,6 +56,8 @@ END_IDX = 19 * 5 - 1                       # 0..2 共 3 个容器
 DOCKER_IMAGE = "chuanzhoupan/trace_spider:250912"
 CONTAINER_CODE_PATH = "/app"
 HOST_CODE_PATH = CODE_BASE_PATH + "/batch_traffice_capture"
+_CONTAINER_PREFIX = CONTAINER_CODE_PATH + "/"  # 容器内路径前缀，后处理时换成宿主机挂载目录
+_HOST_PREFIX = HOST_CODE_PATH + "/"
 DASE_DST = '/netdisk/dataset/ablation_study/batch'
 # =================================
 CREATE_WITH_TTY = True
@@ -42,10 +66,22 @@ RETRY = 1
 NO_TASK_SLEEP_SECONDS = 600
 # =================================
 EXEC_INTERVAL = 1.0
+OUTPUT_UID = 1002  # 结果文件的属主；随任务下发，容器内写完即 chown，宿主机只需确认
+OUTPUT_GID = 1002
+NON_NUMERIC_ID_KEY = 10 ** 18  # read_jobs_batch 中非数字 id 的排序键
 
-_last_exec_ts = 0.0
+_next_exec_slot = 0.0  # 下一个可用的下发时刻（monotonic）
 _last_exec_lock = threading.Lock()
 _stats_lock = threading.Lock()
+_docker_client = None  # 全局 docker SDK 客户端（仅在安装了 docker 包时使用）
+_docker_containers: Dict[str, Any] = {}
+_docker_lock = threading.Lock()
+# 每个容器一个常驻的 action_batch_server.py 进程（docker exec -i），以及保护其管道的锁
+_action_procs: Dict[str, subprocess.Popen] = {}
+_action_locks: Dict[str, threading.Lock] = {}
+# 已创建过的目标目录；同一 domain 在 120 轮 main 里反复出现，只 mkdir 一次
+_mkdirs_done: set = set()
+_mkdirs_lock = threading.Lock()
 
 
 def clear_host_code_subdirs(base: str | Path = HOST_CODE_PATH) -> None:
@@ -56,28 +92,36 @@ def clear_host_code_subdirs(base: str | Path = HOST_CODE_PATH) -> None:
         return
 
     dirs_to_delete = ["ssl_key", "content", "html", "screenshot", "data"]
-    for dir_name in dirs_to_delete:
-        dir_path = base_path / dir_name
-        if dir_path.exists() and dir_path.is_dir():
-            try:
-                shutil.rmtree(dir_path)
-                log(f"删除子目录: {dir_path}")
-            except Exception as e:
-                log(f"WARN: 删除子目录失败: {dir_path} -> {e}")
+
+    def remove(dir_path: Path) -> None:
+        try:
+            shutil.rmtree(dir_path)
+            log(f"删除子目录: {dir_path}")
+        except Exception as e:
+            log(f"WARN: 删除子目录失败: {dir_path} -> {e}")
+
+    # 各子目录互不相关，并发 rmtree，总耗时取决于最大的那棵树而不是总和
+    # 一次 os.scandir 列出 base 下的目录项（is_dir 用 getdents 返回的类型），不再对每个名字各 stat 一次
+    with os.scandir(base_path) as it:
+        targets = [Path(e.path) for e in it
+                   if e.name in dirs_to_delete and e.is_dir(follow_symlinks=False)]
+    if targets:
+        with ThreadPoolExecutor(max_workers=len(targets)) as pool:
+            list(pool.map(remove, targets))
 
 
 def _wait_before_exec():
-    """全局节流：保证所有线程之间，每次 docker exec 至少间隔 EXEC_INTERVAL 秒。"""
-    global _last_exec_ts
-    while True:
-        with _last_exec_lock:
-            now = time.monotonic()
-            delta = _last_exec_ts + EXEC_INTERVAL - now
-            if delta <= 0:
-                _last_exec_ts = now
-                return
-        if delta > 0:
-            time.sleep(min(delta, 0.5))
+    """
+    全局节流：保证所有线程之间，每次 docker exec 至少间隔 EXEC_INTERVAL 秒。
+    在锁内预约一个时刻（按到达顺序排队），出锁后一次 sleep 到该时刻，不再轮询。
+    """
+    global _next_exec_slot
+    with _last_exec_lock:
+        slot = max(time.monotonic(), _next_exec_slot)
+        _next_exec_slot = slot + EXEC_INTERVAL
+    delay = slot - time.monotonic()
+    if delay > 0:
+        time.sleep(delay)
 
 
 def log(*a):
@@ -89,6 +133,101 @@ def run(cmd: List[str], timeout: Optional[int] = None) -> subprocess.CompletedPr
     return subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=timeout)
 
 
+def _get_container(name: str):
+    """按容器名取 docker SDK 的 Container 对象，首次用到时创建客户端并缓存。"""
+    global _docker_client
+    c = _docker_containers.get(name)
+    if c is None:
+        with _docker_lock:
+            if _docker_client is None:
+                _docker_client = docker.from_env(timeout=DOCKER_EXEC_TIMEOUT,
+                                                 max_pool_size=END_IDX - START_IDX + 1)
+            c = _docker_containers[name] = _docker_client.containers.get(name)
+    return c
+
+
+def docker_exec(container: str, argv: List[str], timeout: Optional[int] = None) -> subprocess.CompletedProcess:
+    """
+    在容器内执行命令。装了 docker SDK 就走 exec_run，否则回退到 docker exec 子进程；
+    返回值统一为 CompletedProcess，超时统一抛 subprocess.TimeoutExpired。
+    """
+    if docker is None:
+        return run(["docker", "exec", container, *argv], timeout=timeout)
+    try:
+        res = _get_container(container).exec_run(argv, demux=True)
+    except DockerReadTimeout:
+        raise subprocess.TimeoutExpired(argv, timeout or DOCKER_EXEC_TIMEOUT)
+    out, err = res.output if res.output else (None, None)
+    return subprocess.CompletedProcess(
+        argv, res.exit_code,
+        stdout=(out or b"").decode("utf-8", "replace"),
+        stderr=(err or b"").decode("utf-8", "replace"),
+    )
+
+
+def _action_server(container: str) -> subprocess.Popen:
+    """取容器对应的常驻 action_batch_server 进程；首次使用或进程已退出时重新拉起。"""
+    proc = _action_procs.get(container)
+    if proc is None or proc.poll() is not None:
+        proc = subprocess.Popen(
+            ["docker", "exec", "-i", container,
+             "python", "-u", f"{CONTAINER_CODE_PATH}/action_batch_server.py"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding="utf-8", bufsize=1,
+        )
+        _action_procs[container] = proc
+    return proc
+
+
+def _stop_action_server(container: str) -> None:
+    proc = _action_procs.pop(container, None)
+    if proc is not None and proc.poll() is None:
+        proc.kill()
+        proc.wait()
+
+
+def stop_action_servers() -> None:
+    """关闭所有常驻 action_batch_server：关 stdin 让其读到 EOF 正常退出。"""
+    for container, proc in list(_action_procs.items()):
+        try:
+            proc.stdin.close()
+            proc.wait(timeout=10)
+        except Exception:
+            _stop_action_server(container)
+    _action_procs.clear()
+
+
+def run_action(container: str, payload: str,
+               timeout: Optional[int] = None) -> Tuple[bool, str, Optional[Dict[str, Any]]]:
+    """
+    把一条任务发给容器的常驻 action_batch_server，等待其一行应答。
+    返回 (ok, err, result)，result 为 start_batch_task 的结果（失败时为 None）。
+    超时则杀掉该进程（下次自动重启）并抛 subprocess.TimeoutExpired。
+    """
+    lock = _action_locks.setdefault(container, threading.Lock())
+    with lock:
+        proc = _action_server(container)
+        try:
+            proc.stdin.write(payload + "\n")
+            proc.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            _stop_action_server(container)
+            return False, f"action_batch_server 写入失败: {e}", None
+        ready, _, _ = select.select([proc.stdout], [], [], timeout)
+        if not ready:
+            _stop_action_server(container)
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+        line = proc.stdout.readline()
+    if not line:
+        _stop_action_server(container)
+        return False, "action_batch_server 已退出", None
+    try:
+        reply = json_loads(line)
+    except json.JSONDecodeError:
+        return False, f"action_batch_server 应答无法解析: {line.strip()[:200]}", None
+    return bool(reply.get("ok")), reply.get("error", ""), reply.get("result")
+
+
 def ensure_docker_available():
     try:
         run(["docker", "version"]).check_returncode()
@@ -110,6 +249,24 @@ def container_running(name: str) -> bool:
     return (cp.returncode == 0) and (cp.stdout.strip().lower() == "true")
 
 
+def snapshot_containers(prefix: str) -> Optional[Dict[str, str]]:
+    """
+    一次 docker ps 拿到所有同前缀容器的 {name: state}（running/exited/created…）。
+    失败返回 None，调用方回退到逐个 docker inspect。
+    """
+    cp = run(["docker", "ps", "-a", "--no-trunc",
+              "--format", "{{.Names}}\t{{.State}}", "--filter", f"name=^{prefix}"])
+    if cp.returncode != 0:
+        log(f"WARN: docker ps 失败，回退逐个 inspect：{cp.stderr.strip()}")
+        return None
+    snap: Dict[str, str] = {}
+    for line in cp.stdout.splitlines():
+        name, _, state = line.partition("\t")
+        if name:
+            snap[name] = state.strip().lower()
+    return snap
+
+
 def create_container(name: str, host_code_path: str, image: str):
     uid, gid = str(os.getuid()), str(os.getgid())
     cmd = [
@@ -133,10 +290,17 @@ def create_container(name: str, host_code_path: str, image: str):
 
 
 def start_container(name: str):
-    cp = run(["docker", "start", name])
-    if cp.returncode != 0:
-        log(f"FATAL: 启动容器失败: {name} -> {cp.stderr.strip()}")
-        sys.exit(2)
+    if docker is not None:
+        try:
+            _get_container(name).start()
+        except docker.errors.DockerException as e:
+            log(f"FATAL: 启动容器失败: {name} -> {e}")
+            sys.exit(2)
+    else:
+        cp = run(["docker", "start", name])
+        if cp.returncode != 0:
+            log(f"FATAL: 启动容器失败: {name} -> {cp.stderr.strip()}")
+            sys.exit(2)
     log(f"started container: {name}")
 
 
@@ -156,7 +320,7 @@ def disable_offload_once(name: str):
         fi
         exit $rc
     '''
-    cp = run(["docker", "exec", name, "sh", "-lc", shell])
+    cp = docker_exec(name, ["sh", "-lc", shell])
     if cp.returncode == 0:
         log(f"{name}: offload disabled (TSO/GSO/GRO off)")
     else:
@@ -178,62 +342,123 @@ def read_jobs_batch(csv_path: str) -> Tuple[List[Dict[str, Any]], List[str]]:
         return [], ["id", "url", "domain"]
 
     with p.open("r", encoding="utf-8-sig", newline="") as f:
-        reader = csv.DictReader(f)
-        if reader.fieldnames is None:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
             return [], ["id", "url", "domain"]
 
-        header_fields = [h.strip() for h in reader.fieldnames]
+        header_fields = [h.strip() for h in header]
+        # 列名大小写不敏感，表头只解析一次得到下标，逐行按下标取值，不再每行建 dict
+        idx: Dict[str, int] = {}
+        for i, h in enumerate(header_fields):
+            idx.setdefault(h.lower(), i)
+        id_i, url_i, dom_i = idx.get("id", -1), idx.get("url", -1), idx.get("domain", -1)
 
-        def get_case_insensitive(row: Dict[str, str], key: str) -> str:
-            for k, v in row.items():
-                if k.lower() == key:
-                    return (v or "").strip()
-            return ""
+        def col(row: List[str], i: int) -> str:
+            return row[i].strip() if 0 <= i < len(row) else ""
 
-        # 按 domain 分组
-        domain_groups: Dict[str, List[Dict[str, str]]] = {}
+        # 按 domain 分组；id 在读入时就转成 int 作为排序键，非数字 id 排到组末尾
+        domain_groups: Dict[str, List[Tuple[int, str, str]]] = defaultdict(list)
         for r in reader:
-            rid = get_case_insensitive(r, "id")
-            url = get_case_insensitive(r, "url")
-            dom = get_case_insensitive(r, "domain")
+            url = col(r, url_i)
             if not url:
                 continue
-            if dom not in domain_groups:
-                domain_groups[dom] = []
-            domain_groups[dom].append({"row_id": rid, "url": url})
+            rid = col(r, id_i)
+            try:
+                rid_key = int(rid)
+            except ValueError:
+                rid_key = NON_NUMERIC_ID_KEY
+            domain_groups[col(r, dom_i)].append((rid_key, rid, url))
 
         # 每组按 id 排序，生成任务列表
         jobs: List[Dict[str, Any]] = []
         for domain, urls in domain_groups.items():
-            try:
-                urls.sort(key=lambda x: int(x["row_id"]))
-            except (ValueError, TypeError):
-                urls.sort(key=lambda x: x["row_id"])
-            jobs.append({"domain": domain, "urls": urls})
+            urls.sort(key=itemgetter(0, 1))
+            jobs.append({"domain": domain,
+                         "urls": [{"row_id": rid, "url": url} for _, rid, url in urls]})
 
     return jobs, header_fields
 
 
 def chown_recursive(path: str, uid: int = 1002, gid: int = 1002) -> None:
-    """把 path（文件或目录）及其子项设为 uid:gid。"""
+    """把 path（文件或目录）及其子项设为 uid:gid。属主已正确的普通文件直接返回。"""
     try:
-        os.chown(path, uid, gid, follow_symlinks=False)
-    except Exception:
-        pass
-    if os.path.isdir(path):
-        for root, dirs, files in os.walk(path, followlinks=False):
-            for name in dirs:
-                p = os.path.join(root, name)
-                try:
-                    os.chown(p, uid, gid, follow_symlinks=False)
-                except Exception:
-                    pass
-            for name in files:
-                p = os.path.join(root, name)
+        st = os.lstat(path)
+    except OSError:
+        return
+    is_dir = stat.S_ISDIR(st.st_mode)
+    if (st.st_uid, st.st_gid) != (uid, gid):
+        try:
+            os.chown(path, uid, gid, follow_symlinks=False)
+        except Exception:
+            pass
+    elif not is_dir:
+        return
+    if not is_dir:
+        return
+    # os.scandir 的 DirEntry.is_dir 直接用 getdents 返回的类型，不用像 os.walk 那样逐项 stat
+    stack = [path]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except OSError:
+            continue
+        with it:
+            for entry in it:
                 try:
-                    os.chown(p, uid, gid, follow_symlinks=False)
+                    os.chown(entry.path, uid, gid, follow_symlinks=False)
                 except Exception:
                     pass
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+
+
+def ensure_dir(path: str) -> None:
+    """目录不在已创建集合里才 os.makedirs，并记入集合"""
+    if path in _mkdirs_done:
+        return
+    with _mkdirs_lock:
+        if path not in _mkdirs_done:
+            os.makedirs(path, exist_ok=True)
+            _mkdirs_done.add(path)
+
+
+def _host_path(path: str) -> str:
+    """容器内 /app/... 路径映射为宿主机路径（只换开头的前缀）"""
+    if path.startswith(_CONTAINER_PREFIX):
+        return _HOST_PREFIX + path[len(_CONTAINER_PREFIX):]
+    return path
+
+
+def _prep_dst(domain: str) -> Dict[str, str]:
+    """确保 DASE_DST/<domain>/ 下批量模式用到的子目录存在，返回 {子目录名: 路径}"""
+    dst = os.path.join(DASE_DST, domain)
+    subdirs = {sub: os.path.join(dst, sub) for sub in ("pcap", "ssl_key")}
+    for path in subdirs.values():
+        ensure_dir(path)
+    return subdirs
+
+
+def move_and_chown(src: str, dst_dir: str, uid: int = 1002, gid: int = 1002) -> str:
+    """
+    把 src 移到 dst_dir 下并设为 uid:gid，返回新路径。
+    同一文件系统直接 os.rename（一次系统调用）；跨文件系统（EXDEV，例如 /netdisk 网络盘）时
+    普通文件用 shutil.copyfile（Linux 上走 sendfile/copy_file_range，不经用户态缓冲，
+    也不复制时间戳等元数据）再 unlink，目录才回退到 shutil.move。
+    """
+    dst = os.path.join(dst_dir, os.path.basename(src))
+    try:
+        os.rename(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        if os.path.isdir(src):
+            dst = shutil.move(src, dst_dir)
+        else:
+            shutil.copyfile(src, dst)
+            os.unlink(src)
+    chown_recursive(dst, uid, gid)
+    return dst
 
 
 def exec_batch(task: Dict[str, Any]) -> Tuple[bool, str]:
@@ -241,21 +466,20 @@ def exec_batch(task: Dict[str, Any]) -> Tuple[bool, str]:
     执行批量任务：一个 domain 的多个 URL 共享一个 pcap 和 ssl_key
     task: {"domain": "xxx", "urls": [...], "container": "xxx"}
     """
-    _wait_before_exec()
-    payload = json.dumps(task, ensure_ascii=False)
+    # 序列化（payload 可能含上千个 URL）和日志放在节流之前，节流只管真正的下发
+    payload = json_dumps(task)
     container = task["container"]
-    cmd = [
-        "docker", "exec", container,
-        "python", "-u", f"{CONTAINER_CODE_PATH}/action_batch.py",
-        payload
-    ]
-    log(f"执行命令: {cmd}")
-    cp = run(cmd, timeout=DOCKER_EXEC_TIMEOUT)
+    log(f"下发任务: {container} {payload}")
+    _wait_before_exec()
+    ok, err, result = run_action(container, payload, timeout=DOCKER_EXEC_TIMEOUT)
 
-    if cp.returncode == 0:
+    if ok:
+        # 后处理必须在本容器下一个任务下发前做完：action_batch 开始时会删掉上次 meta 里的
+        # pcap/ssl_key，没移走的结果会被当成残留清掉，所以不与下一次下发重叠
         try:
-            with open(CODE_BASE_PATH + f"/batch_traffice_capture/meta/{container}_last.json", "r", encoding="utf-8") as f:
-                result = json.load(f)
+            if not isinstance(result, dict):
+                # 不读 meta 文件兜底：那可能是更早任务留下的旧结果
+                return False, "action_batch_server reply missing result"
 
             pcap_path = result.get("pcap_path")
             ssl_key_file_path = result.get("ssl_key_file_path")
@@ -263,39 +487,37 @@ def exec_batch(task: Dict[str, Any]) -> Tuple[bool, str]:
             if not pcap_path or not ssl_key_file_path:
                 return False, "result JSON missing pcap_path or ssl_key_file_path"
 
-            domain = task["domain"]
-            dst = os.path.join(DASE_DST, domain)
+            dst = _prep_dst(task["domain"])
 
             # 移动 pcap
-            pcap_dst = os.path.join(dst, 'pcap')
-            os.makedirs(pcap_dst, exist_ok=True)
-            pcap_path_host = pcap_path.replace("/app/", CODE_BASE_PATH + "/batch_traffice_capture/")
-            new_pcap = shutil.move(pcap_path_host, pcap_dst)
-            chown_recursive(new_pcap)
+            move_and_chown(_host_path(pcap_path), dst["pcap"], OUTPUT_UID, OUTPUT_GID)
 
             # 移动 ssl_key
-            ssl_key_dst = os.path.join(dst, 'ssl_key')
-            os.makedirs(ssl_key_dst, exist_ok=True)
-            ssl_key_path_host = ssl_key_file_path.replace("/app/", CODE_BASE_PATH + "/batch_traffice_capture/")
-            new_ssl = shutil.move(ssl_key_path_host, ssl_key_dst)
-            chown_recursive(new_ssl)
+            move_and_chown(_host_path(ssl_key_file_path), dst["ssl_key"], OUTPUT_UID, OUTPUT_GID)
 
             return True, ""
-        except (json.JSONDecodeError, FileNotFoundError, OSError) as e:
+        except (FileNotFoundError, OSError) as e:
             return False, f"post-processing error: {e}"
-    return False, (cp.stderr.strip() or cp.stdout.strip())
+    return False, err
 
 
-def worker_loop_batch(container: str, q: "queue.Queue[Dict[str, Any]]", stats: dict, retry: int):
-    """批量模式的 worker：每个任务是一个 domain 的所有 URL"""
+def worker_loop_batch(container: str, jobs: List[Dict[str, Any]], counter: "itertools.count",
+                      stats: dict, retry: int):
+    """
+    批量模式的 worker：每个任务是一个 domain 的所有 URL
+    任务列表在启动前一次建好、不再追加，各 worker 用共享的 itertools.count 取下标
+    （next() 在 CPython 里是原子的），不需要队列的锁和 task_done/join。
+    """
     while True:
-        try:
-            task = q.get_nowait()
-        except queue.Empty:
+        i = next(counter)
+        if i >= len(jobs):
             return
+        task = jobs[i]
         domain = task.get("domain", "")
         url_count = len(task.get("urls", []))
         task["container"] = container
+        task["owner_uid"] = OUTPUT_UID
+        task["owner_gid"] = OUTPUT_GID
         try:
             log(f"{container} -> start domain={domain} urls={url_count}")
             ok, err = exec_batch(task)
@@ -320,8 +542,6 @@ def worker_loop_batch(container: str, q: "queue.Queue[Dict[str, Any]]", stats: d
             with _stats_lock:
                 stats["fail"] += 1
                 stats["errors"].append((task, err))
-        finally:
-            q.task_done()
 
 
 def prepare_pool_once() -> List[str]:
@@ -336,22 +556,48 @@ def prepare_pool_once() -> List[str]:
     names = build_container_names(CONTAINER_PREFIX, START_IDX, END_IDX)
     log(f"容器池规模={len(names)}: {names[0]} … {names[-1]}")
 
-    created: List[str] = []
+    snap = snapshot_containers(CONTAINER_PREFIX)
+    workers = min(len(names), 32)
+
+    def ensure_created(name: str) -> bool:
+        """不存在则创建，返回是否为本次新建"""
+        exists = (name in snap) if snap is not None else (container_exists(name) is not None)
+        if exists:
+            return False
+        create_container(name, str(host_code), DOCKER_IMAGE)
+        return True
+
+    # 三轮都并发下发给 docker daemon；消费 map 结果，create/start 失败时的 sys.exit 才能传回主线程
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        created = [n for n, new in zip(names, pool.map(ensure_created, names)) if new]
+
+    # docker run -d 新建的容器已在运行，只需 start 快照里不在运行的老容器
+    created_set = set(created)
+    to_start = [
+        n for n in names
+        if n not in created_set
+        and not ((snap.get(n) == "running") if snap is not None else container_running(n))
+    ]
+    if to_start:
+        with ThreadPoolExecutor(max_workers=min(len(to_start), workers)) as pool:
+            list(pool.map(start_container, to_start))
 
-    for n in names:
-        exists = container_exists(n)
-        if exists is None:
-            create_container(n, str(host_code), DOCKER_IMAGE)
-            created.append(n)
+    if created:
+        with ThreadPoolExecutor(max_workers=min(len(created), workers)) as pool:
+            list(pool.map(disable_offload_once, created))
 
-    for n in names:
-        if not container_running(n):
-            start_container(n)
+    return names
 
-    for n in created:
-        disable_offload_once(n)
 
-    return names
+def remove_pool_containers() -> None:
+    """
+    删除所有同前缀的容器：一次 docker ps 取名字，再一次 docker rm -f 全部删掉，
+    不再经 sh + xargs 管道多起几个进程。docker ps 失败时按配置的容器名删。
+    """
+    snap = snapshot_containers(CONTAINER_PREFIX)
+    names = list(snap) if snap is not None else build_container_names(CONTAINER_PREFIX, START_IDX, END_IDX)
+    if names:
+        run(["docker", "rm", "-f", *names])
 
 
 def sig(signum, _frame):
@@ -375,17 +621,18 @@ def main():
             log("没有可处理的任务，退出。")
             return
 
-        q: "queue.Queue[Dict[str, Any]]" = queue.Queue()
-        for t in jobs:
-            q.put(t)
+        # 目标目录在下发前一次性并发建好（/netdisk 上 mkdir 往返较慢），worker 里只剩集合查询
+        with ThreadPoolExecutor(max_workers=min(len(jobs), 16)) as pool:
+            list(pool.map(_prep_dst, {t["domain"] for t in jobs}))
 
         stats = {"ok": 0, "fail": 0, "errors": []}
         log(f"开始执行：domain任务数={len(jobs)}，并发容器={len(names)}，镜像={DOCKER_IMAGE}")
 
+        counter = itertools.count()
+        # 退出 with 时 pool.shutdown(wait=True)，所有 worker 取完任务才返回
         with ThreadPoolExecutor(max_workers=len(names)) as pool:
             for n in names:
-                pool.submit(worker_loop_batch, n, q, stats, RETRY)
-            q.join()
+                pool.submit(worker_loop_batch, n, jobs, counter, stats, RETRY)
 
         log(f"[summary] success={stats['ok']} fail={stats['fail']} total={len(jobs)}")
         if stats["errors"]:
@@ -396,14 +643,17 @@ def main():
     except Exception as e:
         log(f"WARN: 执行异常：{e}")
 
-    time.sleep(60)
+    # 所有 worker 已在 with 退出时结束；只需把本轮写入刷到磁盘，不再固定等 60 秒。
+    # 容器内 sync 刷的也是宿主机同一个页缓存，宿主机调一次 os.sync() 即可，不必逐容器 docker exec
+    os.sync()
     # subprocess.run(f'docker ps -aq -f "name=^{CONTAINER_PREFIX}" | xargs -r docker rm -f', shell=True, check=False)
 
 if __name__ == "__main__":
-    subprocess.run(f'docker ps -aq -f "name=^{CONTAINER_PREFIX}" | xargs -r docker rm -f', shell=True, check=False)
+    remove_pool_containers()
     clear_host_code_subdirs()
     count = 120
     print(f"开始执行数据采集任务,共计{count}次")
     for i in range(120):
         print(f'当前开始执行第{i + 1}次')
         main()
+    stop_action_servers()
@@ -1,67 +1,191 @@
+import errno
 import json
 import shutil
 import sys
 import os
+import signal
 import subprocess
 import time
 import threading
 from datetime import datetime
-from capture import capture, stop_capture
+from pathlib import Path
+import psutil
+from capture import capture, stop_capture, STAGE_DIR
 from logger import logger
-from chrome import create_chrome_driver, open_url_and_save_content
+from chrome import create_chrome_driver, open_url_and_save_content, SCREENSHOT_DPR
 current_index = 0
 allowed_domain = ""
 pcap_lowest_size = 100000
 ssl_key_lowest_size = 1000
+APP_DIR = "/app"
+COPY_BUFFER_SIZE = 1 << 20  # 暂存目录与 /app 不在同一文件系统时的拷贝缓冲
+RESULT_FILE_KEYS = ("pcap_path", "ssl_key_file_path", "content_path", "html_path", "screenshot_path")
+TCP_DRAIN_MAX_SECS = 60    # 等待 TCP 挥手的上限（原先固定等 60 秒，现在只作兜底）
+TCP_DRAIN_POLL_SECS = 0.2
+CAPTURE_READY_TIMEOUT = 5  # 等 tcpdump 打出 "listening on" 的上限
+TCP_DRAIN_GRACE_SECS = 1.0  # 连接都收尾后再留一点时间，让最后的包进 tcpdump
+# 收尾未完成的状态；TIME_WAIT 时 FIN/ACK 已经交换完，不用等它超时
+_TCP_OPEN_STATES = {
+    psutil.CONN_SYN_SENT, psutil.CONN_SYN_RECV, psutil.CONN_ESTABLISHED,
+    psutil.CONN_FIN_WAIT1, psutil.CONN_FIN_WAIT2, psutil.CONN_CLOSE_WAIT,
+    psutil.CONN_CLOSING, psutil.CONN_LAST_ACK,
+}
 
-def _start_reaper():
-    import threading, os, time
-    def _loop():
+def _reap_children(signum, frame):
+    """SIGCHLD 处理：子进程退出时立即回收，避免僵尸进程（不再用每秒轮询的线程）。"""
+    try:
         while True:
-            try:
-                while True:
-                    pid, _ = os.waitpid(-1, os.WNOHANG)
-                    if pid == 0:
-                        break
-            except ChildProcessError:
-                pass
-            time.sleep(1)
-    threading.Thread(target=_loop, daemon=True).start()
-
-_start_reaper()
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+    except ChildProcessError:
+        pass
+
+# 导入发生在主线程（action.py 直接运行或 action_server import），可以在这里装信号处理
+signal.signal(signal.SIGCHLD, _reap_children)
+
+def _kill_by_name(patterns, timeout=2.0):
+    """
+    进程内实现 pkill -f：扫一遍 /proc，命令行包含任一 pattern 的进程先 terminate，
+    timeout 秒内未退出的再 kill。返回是否遇到无权限的进程（需要 sudo 兜底）。
+    """
+    me = os.getpid()
+    victims = []
+    for p in psutil.process_iter(["pid", "cmdline"]):
+        if p.info["pid"] == me:
+            continue
+        cmd = " ".join(p.info["cmdline"] or ())
+        if any(s in cmd for s in patterns):
+            victims.append(p)
+    denied = False
+    for p in victims:
+        try:
+            p.terminate()
+        except psutil.NoSuchProcess:
+            pass
+        except psutil.AccessDenied:
+            denied = True
+    _, alive = psutil.wait_procs(victims, timeout=timeout)
+    for p in alive:
+        try:
+            p.kill()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            pass
+    return denied
+
 
 # 清除浏览器进程
 def kill_chrome_processes():
+    _kill_by_name(("chromedriver", "google-chrome"))
+
+
+def wait_tcp_drained(max_secs=TCP_DRAIN_MAX_SECS, poll=TCP_DRAIN_POLL_SECS):
+    """
+    等容器网络命名空间里所有对外 TCP 连接完成四次挥手（只剩 TIME_WAIT/CLOSED），
+    最多等 max_secs 秒。容器里只有本任务的浏览器在联网，所以不按域名过滤；
+    回环地址（selenium 与 chromedriver 之间）不算。返回实际等待的秒数。
+    """
+    start = time.monotonic()
+    deadline = start + max_secs
+    while True:
+        pending = 0
+        for c in psutil.net_connections(kind="tcp"):
+            if c.status in _TCP_OPEN_STATES and c.raddr and not _is_loopback(c.raddr.ip):
+                pending += 1
+        now = time.monotonic()
+        if pending == 0 or now >= deadline:
+            if pending:
+                logger.warning(f"等待TCP挥手超时，仍有 {pending} 条连接未关闭")
+            return now - start
+        time.sleep(poll)
+
+
+def _is_loopback(ip):
+    return ip.startswith("127.") or ip == "::1" or ip.startswith("::ffff:127.")
+
+
+try:  # 镜像里装了 orjson 就用它生成 meta，否则用标准库
+    import orjson
+
+    def _meta_bytes(result) -> bytes:
+        return orjson.dumps(result, option=orjson.OPT_INDENT_2)
+except ImportError:
+    def _meta_bytes(result) -> bytes:
+        return json.dumps(result, ensure_ascii=False, indent=2).encode("utf-8")  # 中文不转义，缩进美化
+
+
+def write_meta(meta_path, result):
+    """先写临时文件再 os.replace，读 meta 的一方不会读到写了一半的文件。"""
+    tmp_path = f"{meta_path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_meta_bytes(result))
+    os.replace(tmp_path, meta_path)
+
+
+def _stat_or_none(path):
+    """os.stat 的结果，文件不存在（或路径为空）时返回 None。"""
+    if not path:
+        return None
     try:
-        # Run the command to kill all processes containing 'chrome'
-        subprocess.run(['pkill', '-f', 'chromedriver'], check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        subprocess.run(['pkill', '-f', 'google-chrome'], check=False, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except subprocess.CalledProcessError as e:
-        print(f"Error occurred: {e.stderr.decode('utf-8')}")
+        return os.stat(path)
+    except FileNotFoundError:
+        return None
+
+
+def _unlink_many(paths, err_msg):
+    """逐个删除文件，不存在的直接跳过（不再先 exists 再 remove）；单个失败不影响其余文件。"""
+    for path in paths:
+        if not path:
+            continue
+        try:
+            Path(path).unlink(missing_ok=True)
+        except OSError as e:
+            logger.error(f"{err_msg}: {e}")
+
+
+def _publish(path):
+    """
+    把暂存目录（STAGE_DIR）里的结果文件移到 /app 下对应位置并返回新路径；未启用暂存时原样返回。
+    同一文件系统直接 rename；跨设备（tmpfs -> 磁盘）时大缓冲拷贝，并保留属主。
+    """
+    if not path or STAGE_DIR == APP_DIR or not path.startswith(STAGE_DIR + os.sep):
+        return path
+    dst = APP_DIR + path[len(STAGE_DIR):]
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    try:
+        os.rename(path, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        st = os.stat(path)
+        with open(path, "rb") as src, open(dst, "wb", buffering=COPY_BUFFER_SIZE) as out:
+            shutil.copyfileobj(src, out, COPY_BUFFER_SIZE)
+        os.chown(dst, st.st_uid, st.st_gid)
+        os.unlink(path)
+    return dst
 
 
 # 流量捕获进程
-def traffic(index=0, formatted_time=None):
+def traffic(index=0, formatted_time=None, ready=None):
     # 获取当前时间
     current_time = datetime.now()
     # 格式化输出
-    capture(allowed_domain, formatted_time, f"{index}")
+    capture(allowed_domain, formatted_time, f"{index}", ready=ready)
 
 # 清理流量捕获进程
 def kill_tcpdump_processes():
-    try:
-        # Run the command to kill all processes containing 'chrome'
-        # logger.info(f"清理流量捕获进程")
-        subprocess.run(['sudo', 'pkill', '-f', 'tcpdump'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    except subprocess.CalledProcessError as e:
-        print(f"Error occurred: {e.stderr.decode('utf-8')}")
+    # tcpdump 可能属于 root，普通用户杀不掉时才退回一次 sudo pkill
+    if _kill_by_name(("tcpdump",)):
+        subprocess.run(['sudo', 'pkill', '-f', 'tcpdump'], check=False,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
 
 
-def start_task():
+def start_task(payload=None):
     global current_index
     current_index += 1
     global allowed_domain
-    payload = json.loads(sys.argv[1])
+    if payload is None:
+        payload = json.loads(sys.argv[1])
     container = payload["container"]
     row_id = payload["row_id"]
     url = payload["url"]
@@ -69,35 +193,17 @@ def start_task():
 
     # 清理旧文件
     meta_path = f"/app/meta/{container}_last.json"
-    if os.path.exists(meta_path):
-        size = os.path.getsize(meta_path)
-        if size != 0:
-            with open(meta_path, "r", encoding="utf-8") as f:
-                old_result = json.load(f)
-                pcap_path = old_result.get("pcap_path")
-                ssl_key_file_path = old_result.get("ssl_key_file_path")
-                content_path = old_result.get("content_path")
-                html_path = old_result.get("html_path")
-                screenshot_path = old_result.get("screenshot_path")
-                # 删除文件
-                try:
-                    if pcap_path and os.path.exists(pcap_path):
-                        os.remove(pcap_path)
-                    if ssl_key_file_path and os.path.exists(ssl_key_file_path):
-                        os.remove(ssl_key_file_path)
-                    if content_path and os.path.exists(content_path):
-                        os.remove(content_path)
-                    if html_path and os.path.exists(html_path):
-                        os.remove(html_path)
-                    if screenshot_path and os.path.exists(screenshot_path):
-                        os.remove(screenshot_path)
-                except Exception as e:
-                    logger.error(f"删除旧文件失败: {e}")
+    meta_stat = _stat_or_none(meta_path)
+    if meta_stat is not None and meta_stat.st_size != 0:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            old_result = json.load(f)
+        # 删除文件
+        _unlink_many([old_result.get(k) for k in RESULT_FILE_KEYS], "删除旧文件失败")
 
     formatted_time = datetime.now().strftime("%Y%m%d_%H_%M_%S")
+    # _kill_by_name 已经 wait_procs 等到进程退出，无需再 sleep
     kill_chrome_processes()
     kill_tcpdump_processes()
-    time.sleep(1)
 
     # 初始化变量，防止异常时未定义
     content_path = ""
@@ -106,38 +212,46 @@ def start_task():
     pcap_path = ""
 
     # 开流量收集
-    traffic_thread = threading.Thread(target=traffic, kwargs={"index": row_id, "formatted_time":formatted_time} )
+    capture_ready = threading.Event()
+    traffic_thread = threading.Thread(target=traffic, kwargs={"index": row_id, "formatted_time":formatted_time, "ready": capture_ready} )
     traffic_thread.start()
-    time.sleep(1)
+    if not capture_ready.wait(CAPTURE_READY_TIMEOUT):
+        logger.warning(f"tcpdump {CAPTURE_READY_TIMEOUT} 秒内未开始监听，继续执行")
     logger.info(f"创建浏览器")
     browser, ssl_key_file_path = create_chrome_driver(allowed_domain, formatted_time, f"{row_id}")
     logger.info(f"开始访问第{row_id}的词条：{url}")
     try:
-        content_path, html_path, screenshot_path = open_url_and_save_content(browser, url, ssl_key_file_path)
+        content_path, html_path, screenshot_path = open_url_and_save_content(
+            browser, url, ssl_key_file_path, dpr=payload.get("screenshot_dpr", SCREENSHOT_DPR))
     except Exception as e:
         logger.error(f"open_url_and_save_content 异常: {e}")
 
     try:
         browser.quit()  # 彻底退出，会回收 chromedriver 与子进程
     except Exception as e:
+        # 只有 quit 失败时才扫进程兜底；下一轮任务开始时也会再清理一次
         logger.warning(f"browser.quit() 异常: {e}")
-    logger.info("清理浏览器进程(兜底)")
-    kill_chrome_processes()
+        logger.info("清理浏览器进程(兜底)")
+        kill_chrome_processes()
 
-    logger.info(f"等待TCP结束挥手完成，耗时60秒")
-    time.sleep(60)
+    waited = wait_tcp_drained()
+    time.sleep(TCP_DRAIN_GRACE_SECS)
+    logger.info(f"等待TCP结束挥手完成，耗时{waited:.1f}秒")
 
     # 关流量收集
     logger.info(f"关流量收集")
     pcap_path = stop_capture()
-    pcap_file_size = os.path.getsize(pcap_path)
-    ssl_key_file_size = os.path.getsize(ssl_key_file_path)
+    # 每个文件只 stat 一次：大小与是否存在都从同一个结果里取
+    pcap_stat, ssl_key_stat, content_stat, html_stat = map(
+        _stat_or_none, (pcap_path, ssl_key_file_path, content_path, html_path))
+    pcap_file_size = pcap_stat.st_size if pcap_stat else 0
+    ssl_key_file_size = ssl_key_stat.st_size if ssl_key_stat else 0
     logger.info(f"pcap文件大小：{pcap_file_size}，ssl_key文件大小：{ssl_key_file_size}")
     need_restart = False
     page_not_found = False
 
     # 检查HTML是否包含页面未找到的错误信息（仅限BBC）
-    if "bbc" in allowed_domain and os.path.exists(html_path):
+    if "bbc" in allowed_domain and html_stat:
         try:
             with open(html_path, "r", encoding="utf-8") as f:
                 html_content = f.read()
@@ -150,33 +264,23 @@ def start_task():
     if page_not_found:
         # 页面未找到，校验不通过但不重试
         logger.warning("页面不存在，跳过重试")
-    elif pcap_file_size > pcap_lowest_size and ssl_key_file_size > ssl_key_lowest_size and os.path.exists(content_path) and os.path.exists(html_path):
+    elif pcap_file_size > pcap_lowest_size and ssl_key_file_size > ssl_key_lowest_size and content_stat and html_stat:
         logger.info("数据文件校验通过")
     else:
         need_restart = True
 
     # 校验不通过时删除文件（page_not_found 或 need_restart）
     if page_not_found or need_restart:
-        try:
-            if os.path.exists(pcap_path):
-                os.remove(pcap_path)
-            if os.path.exists(ssl_key_file_path):
-                os.remove(ssl_key_file_path)
-            if os.path.exists(content_path):
-                os.remove(content_path)
-            if os.path.exists(html_path):
-                os.remove(html_path)
-            if os.path.exists(screenshot_path):
-                os.remove(screenshot_path)
-        except Exception as e:
-            logger.error(f"删除不合格文件失败: {e}")
+        _unlink_many([pcap_path, ssl_key_file_path, content_path, html_path, screenshot_path], "删除不合格文件失败")
 
     if need_restart and current_index < 4:
         logger.info(f"pcap_lowest_size:{pcap_lowest_size} > pcap_file_size:{pcap_file_size}")
         logger.info(f"ssl_key_lowest_size:{ssl_key_lowest_size} > ssl_key_file_size:{ssl_key_file_size}")
         logger.info("流量文件大小未通过校验，准备重试")
         time.sleep(5)
-        start_task()
+        # 重试时特意重新启动 Chrome，不复用上一轮的 driver：--ssl-key-log-file 只能在启动时指定，
+        # 复用会把密钥写进已删除的旧文件；且复用的连接池会跳过新 pcap 里的 TCP/TLS 握手，流量无法解密
+        return start_task(payload)
     else:
         # 只有校验通过时才写入有效路径，否则写入空字符串
         if need_restart or page_not_found:
@@ -188,13 +292,13 @@ def start_task():
             else:
                 logger.warning(f"重试次数用尽，任务失败: row_id={row_id}")
         else:
+            pcap_path, ssl_key_file_path, content_path, html_path, screenshot_path = map(
+                _publish, (pcap_path, ssl_key_file_path, content_path, html_path, screenshot_path))
             result = {"pcap_path": pcap_path or "", "ssl_key_file_path": ssl_key_file_path or "", "content_path": content_path or "",
                 "html_path": html_path or "", "row_id": row_id, "screenshot_path": screenshot_path or ""}
-        if not os.path.exists(os.path.dirname(meta_path)):
-            os.makedirs(os.path.dirname(meta_path))
-        with open(meta_path, "w", encoding="utf-8") as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)  # 中文不转义，缩进美化
-    time.sleep(1)
+        os.makedirs(os.path.dirname(meta_path), exist_ok=True)
+        write_meta(meta_path, result)
+    return result
 
 if __name__ == "__main__":
     start_task()
@@ -11,6 +11,7 @@ action_batch.py
 import json
 import sys
 import os
+import signal
 import subprocess
 import time
 import threading
@@ -20,22 +21,19 @@ from logger import logger
 from chrome import create_chrome_driver
 from selenium.webdriver.support.ui import WebDriverWait
 
-
-def _start_reaper():
-    def _loop():
-        while True:
-            try:
-                while True:
-                    pid, _ = os.waitpid(-1, os.WNOHANG)
-                    if pid == 0:
-                        break
-            except ChildProcessError:
-                pass
-            time.sleep(1)
-    threading.Thread(target=_loop, daemon=True).start()
+NETWORK_IDLE_SECS = 2.0       # resource 条目数连续这么久不增长即认为网络空闲
+NETWORK_IDLE_MAX_SECS = 10.0  # 网络空闲等待上限
 
 
-_start_reaper()
+def _reap_children(signum, frame):
+    """SIGCHLD 处理：子进程退出时立即回收，避免僵尸进程（不再用每秒轮询的线程）。"""
+    try:
+        while True:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                break
+    except ChildProcessError:
+        pass
 
 
 def kill_chrome_processes():
@@ -58,14 +56,33 @@ def traffic(domain, formatted_time):
     capture(domain, formatted_time, "batch")
 
 
+def wait_network_idle(driver, idle_secs=NETWORK_IDLE_SECS, max_secs=NETWORK_IDLE_MAX_SECS, poll=0.5):
+    """轮询 performance 的 resource 条目数，连续 idle_secs 不再增长即返回；最多等待 max_secs。"""
+    # 默认缓冲只有 250 条，满了之后计数不再增长会被误判为空闲
+    driver.execute_script("performance.setResourceTimingBufferSize(10000);")
+    deadline = time.monotonic() + max_secs
+    last_count = -1
+    stable_since = time.monotonic()
+    while time.monotonic() < deadline:
+        count = driver.execute_script("return performance.getEntriesByType('resource').length")
+        now = time.monotonic()
+        if count != last_count:
+            last_count = count
+            stable_since = now
+        elif now - stable_since >= idle_secs:
+            return
+        time.sleep(poll)
+
+
 def visit_url(driver, url, wait_secs=8):
     """访问 URL，等待页面加载完成"""
     driver.get(url)
     WebDriverWait(driver, wait_secs).until(lambda d: d.execute_script("return document.readyState") == "complete")
-    time.sleep(15)  # 等待页面完全加载
+    wait_network_idle(driver)  # 等待页面后续请求结束，替代固定 sleep(15)
 
 
 def start_batch_task():
+    signal.signal(signal.SIGCHLD, _reap_children)
     payload = json.loads(sys.argv[1])
     container = payload["container"]
     domain = payload["domain"]
@@ -124,11 +141,12 @@ def start_batch_task():
 
     # 关闭浏览器
     try:
-        browser.quit()
+        browser.quit()  # 会回收 chromedriver 与 chrome（含 renderer/zygote 子孙进程）
     except Exception as e:
+        # 只有 quit 失败时才按名字扫进程兜底；记录下来的 PID 在 quit 之后可能已被回收并复用，不能再直接 kill
         logger.warning(f"browser.quit() 异常: {e}")
-    logger.info("清理浏览器进程(兜底)")
-    kill_chrome_processes()
+        logger.info("清理浏览器进程(兜底)")
+        kill_chrome_processes()
 
     # 等待 TCP 挥手完成
     logger.info(f"等待TCP结束挥手完成，耗时60秒")
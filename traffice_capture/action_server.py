@@ -0,0 +1,43 @@
+"""
+常驻版 action：每个容器只启动一次，省掉每个任务一次 docker exec + Python 解释器启动。
+
+    docker exec -i <name> python -u /app/action_server.py
+
+协议（一行一个 JSON）：
+- stdin  每行一个任务 payload，格式与 action.py 的 argv[1] 相同
+- stdout 每个任务回一行 {"ok": true, "result": {...}} 或 {"ok": false, "error": "..."}
+result 即 action.start_task 的返回值（与 /app/meta/{container}_last.json 内容相同），
+宿主机直接用应答里的 result，不再读 meta 文件；meta 文件仍保留，供下个任务开始时清理旧文件。
+"""
+import json
+import os
+import sys
+
+# 协议独占原始 stdout；fd 1 改指向 stderr，避免 print/子进程输出混进应答
+_reply = os.fdopen(os.dup(sys.stdout.fileno()), "w", encoding="utf-8", buffering=1)
+os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+
+import action
+from logger import logger, reopen_log_file
+
+
+def serve():
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            reopen_log_file()
+            payload = json.loads(line)
+            # 重试计数按任务计，而不是按进程
+            action.current_index = 0
+            result = action.start_task(payload)
+            reply = {"ok": True, "result": result}
+        except Exception as e:
+            logger.error(f"action_server 任务异常: {e!r}")
+            reply = {"ok": False, "error": repr(e)}
+        _reply.write(json.dumps(reply, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    serve()
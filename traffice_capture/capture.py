@@ -2,13 +2,28 @@ import os
 from logger import logger
 import shutil
 import subprocess
-import psutil
+import select
 from datetime import datetime
 
-def capture(task_name, formatted_time, parsers):
+# 设置 STAGE_DIR（如挂载的 tmpfs /dev/shm/app）时抓包先写到这里，任务校验通过后再移到 /app
+STAGE_DIR = os.getenv("STAGE_DIR", "/app")
+
+# tcpdump -B 的内核抓包缓冲（单位 KiB）。宿主机上最多同时跑 END_IDX+1（252）个容器，
+# 每个 4 MiB 合计约 1 GiB；不要按单容器的需求调大
+TCPDUMP_BUFFER_KIB = "4096"
+
+process = None
+process_pidfd = None
+process_path = None  # capture() 写入的 pcap 路径，stop_capture 直接返回，不再读 /proc/<pid>/cmdline
+
+def capture(task_name, formatted_time, parsers, ready=None):
+    """
+    启动 tcpdump 并阻塞到它退出（调用方放在线程里跑）。tcpdump 在 stderr 打出 "listening on"
+    即表示已开始抓包，此时 set ready（threading.Event），调用方据此继续，不必固定 sleep。
+    """
     current_time = datetime.now()
     current_data = current_time.strftime("%Y%m%d")
-    data_dir = os.path.join("/app", "data", current_data)
+    data_dir = os.path.join(STAGE_DIR, "data", current_data)
     os.makedirs(data_dir, exist_ok=True)
     filename = f'{parsers}_'
 
@@ -17,37 +32,69 @@ def capture(task_name, formatted_time, parsers):
     # 设置tcpdump命令的参数
     tcpdump_command = [
         "tcpdump",
+        "-n",  # 不做反向 DNS 解析
+        "-p",  # 不开混杂模式，只抓本容器的流量
+        "--immediate-mode",  # 包到即交付，不等内核缓冲超时
+        "-B", TCPDUMP_BUFFER_KIB,  # 内核抓包缓冲，减少丢包和唤醒次数
+        "-s", "0",  # 抓完整包
+        # tcpdump 直接写文件：改成 -w - 再由本进程 splice 到文件只会多一次管道中转，
+        # 抓包本身的拷贝仍在 tcpdump 里；要绕开磁盘可用 STAGE_DIR 把输出放到 tmpfs
         "-w",
         traffic_name,  # 输出文件的路径
     ]
 
     logger.info(f'tcpdump_command:{tcpdump_command}')
-    global process
+    global process, process_pidfd, process_path
     # 开流量收集
-    process = subprocess.Popen(tcpdump_command)
-    #
+    process = subprocess.Popen(tcpdump_command, stderr=subprocess.PIPE)
+    process_path = traffic_name
+    # pidfd 在进程退出时变为可读，stop_capture 可以直接阻塞等待，不用轮询
+    try:
+        process_pidfd = os.pidfd_open(process.pid)
+    except (AttributeError, OSError):  # Python < 3.9 或内核 < 5.3
+        process_pidfd = None
+    for line in process.stderr:
+        if b"listening on" in line:
+            break
+        logger.info(f"tcpdump: {line.decode(errors='replace').rstrip()}")
+    # 启动失败时 stderr 直接 EOF，同样 set，调用方不会一直等
+    if ready is not None:
+        ready.set()
     logger.info("开始捕获流量")
+    # 继续读完 stderr（退出时的统计信息），避免管道写满阻塞 tcpdump
+    for line in process.stderr:
+        logger.info(f"tcpdump: {line.decode(errors='replace').rstrip()}")
     return traffic_name
 
 
 def stop_capture() -> str:
-    global process
-    # 获取当前进程的PID
-    pid = process.pid
-    p = psutil.Process(pid)
-    cmdline = p.cmdline()
-    file_path = cmdline[-1]
+    global process, process_pidfd
+    file_path = process_path
     os.chown(file_path, int(os.getenv('HOST_UID')), int(os.getenv('HOST_GID')))
     # 先优雅终止，再等待；若不退出再 kill，并最终 wait()，确保不会留僵尸
     try:
         process.terminate()
-        process.wait(timeout=5)
+        _wait_exit(process, 5)
     except Exception:
         try:
             process.kill()
         finally:
             try:
-                process.wait(timeout=3)
+                _wait_exit(process, 3)
             except Exception:
                 pass
+    finally:
+        if process_pidfd is not None:
+            os.close(process_pidfd)
+            process_pidfd = None
     return file_path
+
+
+def _wait_exit(proc, timeout):
+    """等待 proc 退出：有 pidfd 就 select 到进程退出那一刻，否则退回 Popen.wait 的轮询。"""
+    if process_pidfd is not None:
+        ready, _, _ = select.select([process_pidfd], [], [], timeout)
+        if not ready:
+            raise subprocess.TimeoutExpired(proc.args, timeout)
+    # 回收（可能已被 SIGCHLD 处理函数回收，Popen.wait 会处理 ECHILD）
+    proc.wait(timeout=timeout)
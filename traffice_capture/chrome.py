@@ -9,9 +9,27 @@ import time
 import math
 from pathlib import Path
 from typing import Optional
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
 from selenium.webdriver.support.ui import WebDriverWait  # 从selenium.webdriver.support.wait改为支持ui
 
-JS_SELECT_ALL_AND_COPY_CAPTURE = r"""
+DEBUG_NETLOG = os.getenv("DEBUG_NETLOG") == "1"  # 为 1 时额外记录 Chrome net-log 和 performance 日志
+STAGE_DIR = os.getenv("STAGE_DIR", "/app")  # 与 capture.py 一致：ssl_key/content/html/screenshot 先写到暂存目录
+NETWORK_IDLE_SECS = 2.0       # resource 条目数连续这么久不增长即认为网络空闲
+NETWORK_IDLE_MAX_SECS = 15.0  # 网络空闲等待上限（即原先固定 sleep 的 15 秒）
+SCREENSHOT_DPR = 1.0  # 整页截图的设备像素比；2.0 时 PNG 体积约为 4 倍，需要高清图时由任务 payload 指定
+WRITE_BUFFER_SIZE = 1 << 17  # 128 KB 写缓冲，大页面 HTML 少几次 write 调用
+
+# 折叠“空白行 + 换行”为单个换行；模块加载时编译一次。
+# 开头的先行断言让正则在普通文字位置上第一个字符就失败，不必进入分组回溯（结果与不加时相同）
+WS_NL_RE = re.compile(r'(?=[ \t\f\u00A0\u3000\u200B\u200C\u200D\uFEFF\u2060\u00AD\v\r\n])'
+                      r'(?:[ \t\f\u00A0\u3000\u200B\u200C\u200D\uFEFF\u2060\u00AD\v]*\r?\n)+')
+
+def _compact_js(src):
+    """去掉缩进、空行和整行 // 注释；按行保留换行，不会改变 JS 的自动分号语义。"""
+    lines = (line.strip() for line in src.splitlines())
+    return "\n".join(line for line in lines if line and not line.startswith("//"))
+
+JS_SELECT_ALL_AND_COPY_CAPTURE = _compact_js(r"""
 function __select_all_and_copy_capture(){
   try{
     const sel = window.getSelection();
@@ -68,12 +86,18 @@ function __select_all_and_copy_capture(){
     return { error: String(e) };
   }
 }
-"""
+""")
+
+# 函数体在创建 driver 时通过 addScriptToEvaluateOnNewDocument 注入每个新文档，这里只需按名字调用；
+# 未定义（例如注入失败）时返回 null，由调用方退回整段脚本
+JS_CALL_SELECT_ALL_AND_COPY_CAPTURE = (
+    "return typeof __select_all_and_copy_capture === 'function' ? __select_all_and_copy_capture() : null;"
+)
 
 def create_chrome_driver(task_name, formatted_time, parsers):
     current_time = datetime.now()
     current_data = current_time.strftime("%Y%m%d")
-    data_dir = os.path.join('/app', "ssl_key", current_data)
+    data_dir = os.path.join(STAGE_DIR, "ssl_key", current_data)
     os.makedirs(data_dir, exist_ok=True)
     filename = f'{parsers}_'
 
@@ -81,8 +105,7 @@ def create_chrome_driver(task_name, formatted_time, parsers):
 
     # 在当前目录中创建download文件夹
     download_folder = os.path.join(os.getcwd(), 'download')
-    if not os.path.exists(download_folder):
-        os.makedirs(download_folder)
+    os.makedirs(download_folder, exist_ok=True)
 
     os.environ["SE_OFFLINE"] = "true"
     _ACCEPT_LANGUAGE = "zh-CN,zh;q=0.9"
@@ -107,8 +130,10 @@ def create_chrome_driver(task_name, formatted_time, parsers):
     chrome_options.add_argument("--no-first-run")
     chrome_options.add_argument("--no-default-browser-check")
     chrome_options.add_argument("--homepage=about:blank")
-    chrome_options.add_argument("--log-net-log=/tmp/netlog.json")
-    chrome_options.add_argument("--net-log-capture-mode=Everything")
+    if DEBUG_NETLOG:
+        # 排查问题时才打开：Everything 模式会把每个 socket/DNS/TLS 事件序列化到磁盘
+        chrome_options.add_argument("--log-net-log=/tmp/netlog.json")
+        chrome_options.add_argument("--net-log-capture-mode=Everything")
     print(f"SSL 密钥日志文件路径: {ssl_key_file_path}")
 
     # 设置实验性首选项
@@ -124,8 +149,9 @@ def create_chrome_driver(task_name, formatted_time, parsers):
     }
     chrome_options.add_experimental_option("prefs", prefs)
 
-    # 启用性能日志记录
-    chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+    # 性能日志（driver 端缓存全部 CDP 事件）同样只在调试时启用，正常任务没有读取它
+    if DEBUG_NETLOG:
+        chrome_options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
 
     # 创建 WebDriver 实例
     service = Service(executable_path="/usr/local/bin/chromedriver")
@@ -137,37 +163,66 @@ def create_chrome_driver(task_name, formatted_time, parsers):
                             Object.defineProperty(navigator,"webdriver",{get:()=>undefined});
                             Object.defineProperty(navigator,"language",{get:()=> "zh-CN"});
                             Object.defineProperty(navigator,"languages",{get:()=> ["zh-CN","zh"]});
-                            '''.strip()})
+                            '''.strip() + "\n" + JS_SELECT_ALL_AND_COPY_CAPTURE})
     return browser, ssl_key_file_path
 
-def open_url_and_save_content(driver, url, ssl_key_file_path, wait_secs=8):
+def _ensure_parent_dirs(paths):
+    # 不缓存“已创建”：宿主机清理目录时常驻的 action_server 感知不到
+    for parent in {os.path.dirname(p) for p in paths}:
+        os.makedirs(parent, exist_ok=True)
+
+def wait_network_idle(driver, idle_secs=NETWORK_IDLE_SECS, max_secs=NETWORK_IDLE_MAX_SECS, poll=0.5):
+    """轮询 performance 的 resource 条目数，连续 idle_secs 不再增长即返回；最多等待 max_secs。"""
+    # 默认缓冲只有 250 条，满了之后计数不再增长会被误判为空闲
+    driver.execute_script("performance.setResourceTimingBufferSize(10000);")
+    deadline = time.monotonic() + max_secs
+    last_count = -1
+    stable_since = time.monotonic()
+    while time.monotonic() < deadline:
+        count = driver.execute_script("return performance.getEntriesByType('resource').length")
+        now = time.monotonic()
+        if count != last_count:
+            last_count = count
+            stable_since = now
+        elif now - stable_since >= idle_secs:
+            return
+        time.sleep(poll)
+
+def open_url_and_save_content(driver, url, ssl_key_file_path, wait_secs=8, dpr=SCREENSHOT_DPR):
     driver.get(url)
     WebDriverWait(driver, wait_secs).until(lambda d: d.execute_script("return document.readyState") == "complete")
-    time.sleep(15)
+    wait_network_idle(driver)  # 等待页面后续请求结束，替代固定 sleep(15)
     screenshot_path = ssl_key_file_path.replace("_ssl_key.log", ".png").replace("/ssl_key/", "/screenshot/")
-    if not os.path.exists(os.path.dirname(screenshot_path)):
-        os.makedirs(os.path.dirname(screenshot_path))
-    screenshot_full_page(driver, Path(screenshot_path), dpr=2.0)
-    script = JS_SELECT_ALL_AND_COPY_CAPTURE + "\nreturn __select_all_and_copy_capture();"
-    res = driver.execute_script(script)
-    if not isinstance(res, dict) or res.get("error"):
-        raise RuntimeError(f"JS失败: {res}")
-    plain = re.sub(r'(?:[ \t\f\u00A0\u3000\u200B\u200C\u200D\uFEFF\u2060\u00AD\v]*\r?\n)+', '\n', res.get("plain", ""))
     content_path = ssl_key_file_path.replace("_ssl_key.log", ".text").replace("/ssl_key/", "/content/")
     html_path = ssl_key_file_path.replace("_ssl_key.log", ".html").replace("/ssl_key/", "/html/")
-    if not os.path.exists(os.path.dirname(content_path)):
-        os.makedirs(os.path.dirname(content_path))
-    with open(content_path, "w", encoding="utf-8") as f:
-        f.write(plain)
-    html = driver.page_source  # 此刻的 DOM（包含已渲染的动态内容）
-    if not os.path.exists(os.path.dirname(html_path)):
-        os.makedirs(os.path.dirname(html_path))
-    with open(html_path, "w", encoding="utf-8") as f:
-        f.write(html)
+    _ensure_parent_dirs((screenshot_path, content_path, html_path))
+    # 浏览器命令在同一会话里只能串行，这里把解码/落盘交给后台线程，和后面的浏览器命令重叠
+    with ThreadPoolExecutor(max_workers=2) as writer:
+        futures = []
+        futures.append(screenshot_full_page(driver, Path(screenshot_path), dpr=dpr, writer=writer))
+        res = driver.execute_script(JS_CALL_SELECT_ALL_AND_COPY_CAPTURE)
+        if res is None:
+            res = driver.execute_script(JS_SELECT_ALL_AND_COPY_CAPTURE + "\nreturn __select_all_and_copy_capture();")
+        if not isinstance(res, dict) or res.get("error"):
+            raise RuntimeError(f"JS失败: {res}")
+        futures.append(writer.submit(_write_utf8, content_path, WS_NL_RE.sub('\n', res.get("plain", ""))))
+        html = driver.page_source  # 此刻的 DOM（包含已渲染的动态内容）
+        futures.append(writer.submit(_write_utf8, html_path, html))
+        for fut in futures:
+            fut.result()  # 写文件失败时把异常抛给调用方
     return content_path, html_path, screenshot_path
 
-def screenshot_full_page(driver: webdriver.Chrome, out_path: Path, dpr: Optional[float] = None) -> None:
-    """整页长截图：通过 CDP 获取内容尺寸并原生捕获，不做滚动拼接。"""
+def _write_utf8(path, text):
+    """一次性编码成 UTF-8 后以二进制写入，绕开 TextIOWrapper 的分块编码。"""
+    with open(path, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(text.encode("utf-8"))
+
+def screenshot_full_page(driver: webdriver.Chrome, out_path: Path, dpr: Optional[float] = None,
+                         writer: Optional[Executor] = None) -> Optional[Future]:
+    """
+    整页长截图：通过 CDP 获取内容尺寸并原生捕获，不做滚动拼接。
+    给出 writer 时 base64 解码和写盘提交到 writer，返回对应 Future；否则同步写入并返回 None。
+    """
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
     # 计算页面内容尺寸
@@ -198,7 +253,16 @@ def screenshot_full_page(driver: webdriver.Chrome, out_path: Path, dpr: Optional
         "captureBeyondViewport": True
     })
     png_b64 = data.get("data")
-    out_path.write_bytes(base64.b64decode(png_b64))
+    future = None
+    if writer is not None:
+        future = writer.submit(_write_png, out_path, png_b64)
+    else:
+        _write_png(out_path, png_b64)
 
     # 恢复度量，避免影响后续操作
-    driver.execute_cdp_cmd("Emulation.clearDeviceMetricsOverride", {})
\ No newline at end of file
+    driver.execute_cdp_cmd("Emulation.clearDeviceMetricsOverride", {})
+    return future
+
+
+def _write_png(out_path: Path, png_b64: str) -> None:
+    out_path.write_bytes(base64.b64decode(png_b64))
\ No newline at end of file